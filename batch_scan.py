@@ -0,0 +1,171 @@
+import argparse  #command line for the batch scanner
+import json
+import multiprocessing  #one decoder process per core, pyzbar and OpenCV do the heavy lifting in C
+import os
+import sys
+import time
+from collections import deque
+
+import cv2
+from pyzbar.pyzbar import decode
+
+from final import Database, book_symbols
+from isbn import normalise_isbn
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+SCALES = (1.0, 0.5)  #full resolution first, then half size, which zbar sometimes reads better on big photos
+
+
+def read_isbns(gray):#every valid ISBN in a grayscale image as ISBN-13, a shelf photo can hold many
+    for scale in SCALES:
+        image = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        isbns = []
+        for barcode in decode(image, symbols=book_symbols()):
+            isbn = normalise_isbn(barcode.data.decode("utf-8"))
+            if isbn and isbn not in isbns:
+                isbns.append(isbn)
+        if isbns:
+            return isbns
+    return []
+
+
+def scan_image(path):#runs in a worker process, returns (path, isbns) or (path, None) if the file can't be read
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return path, None
+    return path, read_isbns(gray)
+
+
+def scan_frame(job):#runs in a worker process, job is (frame number, grayscale frame)
+    number, gray = job
+    return number, read_isbns(gray)
+
+
+def list_images(directory):#image files in a directory and its subdirectories, in a stable order
+    paths = []
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(folder, name))
+    return sorted(paths)
+
+
+def video_frames(path, every):#(frame number, grayscale frame) for every Nth frame, converted here so workers get a third of the bytes
+    cap = cv2.VideoCapture(path)
+    number = 0
+    try:
+        while True:
+            ok = cap.grab()  #grab without decoding the frames that are skipped
+            if not ok:
+                return
+            if number % every == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield number, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            number += 1
+    finally:
+        cap.release()
+
+
+class BatchScanner:#decodes files on a process pool and looks every ISBN up in the main process
+    def __init__(self, db, workers=None, every=5, out=sys.stdout):
+        self.db = db
+        self.workers = workers or os.cpu_count() or 1
+        self.every = every  #video frames between decodes, neighbouring frames nearly always show the same books
+        self.out = out
+        self.books = {}  #ISBN -> row, a shelf audit sees the same books again and again
+        self.files = 0
+        self.results = 0
+        self.started = None
+
+    def run(self, inputs):#inputs are image files, directories of images or video files
+        self.started = time.perf_counter()
+        images = []
+        videos = []
+        for path in inputs:
+            if os.path.isdir(path):
+                images.extend(list_images(path))
+            elif os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                images.append(path)
+            else:
+                videos.append(path)
+        with multiprocessing.Pool(self.workers) as pool:
+            #unordered, so one slow photo doesn't hold back the lines behind it
+            for path, isbns in pool.imap_unordered(scan_image, images, chunksize=4):
+                self.files += 1
+                if isbns is None:
+                    self.write({"source": path, "error": "unreadable image"})
+                elif not isbns:
+                    self.write({"source": path, "isbn": None})
+                for isbn in isbns or []:
+                    self.write(self.result(isbn, {"source": path}))
+            for path in videos:
+                self.scan_video(pool, path)
+        return self.files, self.results
+
+    def scan_video(self, pool, path):#each ISBN is reported once per video, at the first frame it was read in
+        self.files += 1
+        seen = set()
+        #at most two frames per worker in flight, Pool.imap would read and queue the whole video ahead of the workers
+        pending = deque()
+        for job in video_frames(path, self.every):
+            pending.append(pool.apply_async(scan_frame, (job,)))
+            if len(pending) >= self.workers * 2:
+                self.video_result(path, pending.popleft().get(), seen)
+        while pending:
+            self.video_result(path, pending.popleft().get(), seen)
+        if not seen:
+            self.write({"source": path, "isbn": None})
+
+    def video_result(self, path, result, seen):
+        number, isbns = result
+        for isbn in isbns:
+            if isbn not in seen:
+                seen.add(isbn)
+                self.write(self.result(isbn, {"source": path, "frame": number}))
+
+    def result(self, isbn, record):
+        if isbn not in self.books:
+            self.books[isbn] = self.db.get_book_data(isbn)
+        book = self.books[isbn]
+        record["isbn"] = isbn
+        record["found"] = book is not None
+        if book is not None:
+            record["book"] = self.db.book_dict(book)
+        return record
+
+    def write(self, record):
+        self.results += 1
+        self.out.write(json.dumps(record) + "\n")
+
+    def report(self, out=sys.stderr):
+        elapsed = time.perf_counter() - self.started
+        rate = self.files / elapsed if elapsed else 0.0
+        print(f"{self.files} files, {self.results} results, {elapsed:.1f} s, {rate:.1f} files/s", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode ISBN barcodes in image and video files without a display")
+    parser.add_argument("inputs", nargs="+", help="image files, directories of images or video files")
+    parser.add_argument("--db", default="Y13/Booktest.db", help="path to the books database")
+    parser.add_argument("--workers", type=int, help="decoder processes, defaults to one per core")
+    parser.add_argument("--every", type=int, default=5, help="decode every Nth video frame")
+    parser.add_argument("--output", help="JSONL file to write, defaults to standard output")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        scanner = BatchScanner(db, args.workers, max(args.every, 1), out)
+        scanner.run(args.inputs)
+        scanner.report()
+    finally:
+        if args.output:
+            out.close()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
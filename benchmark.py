@@ -0,0 +1,434 @@
+import argparse  #command line for the benchmarks
+import itertools
+import json
+import os
+import platform
+import queue
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+from final import (BarcodeDecoder, CachedDatabase, ConsensusVoter, Database, GUI, ScanApp, ScanCore, Station,
+                   CameraSession, load_config, np, tk, cv2)
+from import_books import Importer
+from isbn import ean13_check_digit
+from loadtest import percentile
+
+
+#EAN-13 bar patterns, 1 is a dark module
+L_CODES = ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"]
+R_CODES = ["".join("1" if bit == "0" else "0" for bit in code) for code in L_CODES]
+G_CODES = [code[::-1] for code in R_CODES]
+PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLG", "LGLGLL", "LGLGGL", "LGGLGL"]  #set by the first digit
+
+GENRES = ["Fiction", "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror", "History", "Biography",
+          "Computing", "Science", "Travel", "Poetry", "Drama", "Children", "Young Adult", "Cookery", "Art", "Sport", "Music"]
+WORDS = ["space", "war", "love", "journey", "city", "secret", "family", "king", "ocean", "machine", "garden", "winter",
+         "murder", "island", "dragon", "letter", "river", "empire", "friend", "storm", "village", "code", "ghost", "summer"]
+CATALOGUE_VERSION = 2  #part of the catalogue file names, bump it when make_catalogue changes so old ones aren't reused
+
+
+def made_up_words(count, seed):#distinct pronounceable words, the same ones on every run
+    rng = random.Random(seed)
+    syllables = [consonant + vowel for consonant in "bdfghklmnprstvz" for vowel in "aeiou"]
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+#catalogue text follows Zipf's law like real text does: a few words are in a large share of the books, most in very few
+VOCABULARY = WORDS + [word for word in made_up_words(20000, 0) if word not in WORDS]
+VOCABULARY_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+FIRST_NAMES = [word.capitalize() for word in made_up_words(300, 1)]
+SURNAMES = [word.capitalize() for word in made_up_words(5000, 2)]
+
+
+def zipf_words(rng, count):
+    return rng.choices(VOCABULARY, cum_weights=VOCABULARY_WEIGHTS, k=count)
+BOOKS_TABLE = ("CREATE TABLE books (ISBN TEXT, Name TEXT, Author TEXT, Genre TEXT, Rating REAL, Summary TEXT, "
+               "GoodReview1 TEXT, GoodReview2 TEXT, BadReview1 TEXT, BadReview2 TEXT, Pages INTEGER, Loved TEXT)")
+
+
+def isbn_for(number):#the number-th ISBN of every generated catalogue, so smaller catalogues are a prefix of bigger ones
+    body = f"978{number:09d}"
+    return body + ean13_check_digit(body)
+
+
+def ean13_modules(code):#the 95 modules of an EAN-13 as a string of 0s and 1s
+    left = "".join((L_CODES if parity == "L" else G_CODES)[int(digit)] for parity, digit in zip(PARITY[int(code[0])], code[1:7]))
+    right = "".join(R_CODES[int(digit)] for digit in code[7:])
+    return "101" + left + "01010" + right + "101"
+
+
+def synthetic_frame(code, size=(1280, 720), module=3, noise=12.0, rng=None):#a BGR frame with the barcode in the middle and sensor-like noise
+    width, height = size
+    frame = np.full((height, width), 235, dtype=np.float32)
+    if code:
+        bars = np.array([bit == "1" for bit in ean13_modules(code)]).repeat(module)
+        x1 = (width - len(bars)) // 2
+        y1, y2 = int(height * 0.35), int(height * 0.65)
+        frame[y1:y2, x1:x1 + len(bars)][:, bars] = 25
+    if noise:
+        frame += (rng or np.random.default_rng()).normal(0, noise, frame.shape).astype(np.float32)
+    gray = np.clip(frame, 0, 255).astype(np.uint8)
+    return np.repeat(gray[:, :, np.newaxis], 3, axis=2)
+
+
+def load_frames(path):#recorded frames from a directory of images or a video file
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                frames.append(frame)
+        return frames
+    cap = cv2.VideoCapture(path)
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def summarize(samples, seconds=None):#latency percentiles in ms, plus throughput when the wall time is known
+    ordered = sorted(samples)
+    result = {"count": len(ordered)}
+    if ordered:
+        result["mean_ms"] = round(sum(ordered) / len(ordered) * 1000, 4)
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result[name] = round(percentile(ordered, fraction) * 1000, 4)
+    if seconds:
+        result["per_second"] = round(len(ordered) / seconds, 1)
+    return result
+
+
+def bench_decode(frames, expected, config):#the decoder the scan core runs, one frame at a time
+    decoder = BarcodeDecoder(**config["decode"])
+    latencies = []
+    correct = reads = 0
+    started = time.perf_counter()
+    for frame, isbn in zip(frames, expected):
+        t0 = time.perf_counter()
+        result = decoder(frame)
+        latencies.append(time.perf_counter() - t0)
+        reads += result is not None
+        correct += result is not None and result == isbn
+    result = summarize(latencies, time.perf_counter() - started)
+    result["reads"] = reads
+    if any(expected):
+        result["accuracy"] = round(correct / sum(1 for isbn in expected if isbn), 4)
+    return result
+
+
+class ReplayCamera:#stands in for CameraSession, handing the scan core frames pushed by the benchmark
+    def __init__(self):
+        self.feeding = threading.Event()
+        self.connected = threading.Event()
+        self.connected.set()
+        self.frames = queue.Queue(maxsize=2)
+
+    def push(self, frame):#dropped like a real camera's frames when the decoder isn't keeping up
+        if self.feeding.is_set():
+            try:
+                self.frames.put_nowait(frame)
+            except queue.Full:
+                pass
+
+    def next_frame(self, timeout):
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear_frames(self):
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+
+
+def bench_pipeline(frames, db, config, scans, fps, rng):#scan to result: frames in at the camera rate until the core reports the looked-up book
+    camera = ReplayCamera()
+    station = Station("benchmark", camera, BarcodeDecoder(**config["decode"]), ConsensusVoter(**config["consensus"]))
+    core = ScanCore([station], db, config["recommendations"], config["core"]["decode_workers"])
+    core.start()
+    interval = 1.0 / fps if fps else 0.001
+    latencies = []
+    failed = 0
+    isbns = list(frames)
+    started = time.perf_counter()
+    try:
+        for _ in range(scans):
+            isbn = rng.choice(isbns)
+            station.resume()
+            t0 = time.perf_counter()
+            event = None
+            while event is None and time.perf_counter() - t0 < 2.0:
+                camera.push(frames[isbn])
+                try:
+                    event = station.events.get(timeout=interval)
+                except queue.Empty:
+                    pass
+            if event is None or event[0] != "book" or event[2] != isbn:
+                failed += 1
+            else:
+                latencies.append(time.perf_counter() - t0)
+    finally:
+        core.stop()
+    result = summarize(latencies, time.perf_counter() - started)
+    result["failed"] = failed
+    result["fps"] = fps
+    return result
+
+
+def make_catalogue(path, rows, rng):#a generated catalogue of the given size, kept on disk and reused by later runs
+    if os.path.exists(path):
+        return path
+    print(f"Generating a {rows}-book catalogue in {path}...", file=sys.stderr)
+    for leftover in (path + ".tmp", path + ".tmp-wal", path + ".tmp-shm"):  #from a run that was interrupted
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    conn = sqlite3.connect(path + ".tmp")  #the legacy books table, Database adds everything else when it migrates
+    conn.execute(BOOKS_TABLE)
+    conn.close()
+
+    def records():
+        for number in range(rows):
+            name = " ".join(zipf_words(rng, rng.randint(1, 4))).title()
+            author = f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}"
+            yield {"ISBN": isbn_for(number), "Name": name, "Author": author,
+                   "Genre": GENRES[number % len(GENRES)], "Rating": round(rng.uniform(1, 5), 1), "Summary": " ".join(zipf_words(rng, 12)),
+                   "GoodReview1": "gripping", "GoodReview2": "lovely", "BadReview1": "slow", "BadReview2": "long",
+                   "Pages": rng.randint(80, 900)}
+
+    db = Database(path + ".tmp")
+    with open(os.devnull, "w") as quiet:
+        Importer(db, progress_every=max(rows, 1), out=quiet).run(records())
+    db.close()
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def bench_lookups(path, rows, lookups, config, rng):#book rows and output-page views, from disk and from the cache
+    results = {}
+    db = Database(path)
+    isbns = [isbn_for(rng.randrange(rows)) for _ in range(lookups)]
+    for name, call in (("book", lambda isbn: db.get_book_data(isbn)),
+                       ("view", lambda isbn: db.get_book_view(isbn, config["recommendations"]["count"], "rating")),
+                       ("miss", lambda isbn: db.get_book_data(isbn[:-1] + "X"))):
+        latencies = []
+        started = time.perf_counter()
+        for isbn in isbns:
+            t0 = time.perf_counter()
+            call(isbn)
+            latencies.append(time.perf_counter() - t0)
+        results[name] = summarize(latencies, time.perf_counter() - started)
+    db.close()
+
+    #the kiosk case: a small set of books scanned again and again, served from the LRU
+    cached = CachedDatabase(path, cache_size=config["database"]["cache_size"])
+    hot = isbns[:100]
+    for isbn in hot:
+        cached.get_book_view(isbn, config["recommendations"]["count"], "rating")
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(lookups):
+        t0 = time.perf_counter()
+        cached.get_book_view(rng.choice(hot), config["recommendations"]["count"], "rating")
+        latencies.append(time.perf_counter() - t0)
+    results["cached_view"] = summarize(latencies, time.perf_counter() - started)
+    cached.close()
+    return results
+
+
+SEARCH_TARGET_MS = 20  #p99 a search may take, it runs at every pause in typing
+
+
+def search_texts(db, rows, searches, rng):#(kind, text) pairs like a kiosk user types them, words as common as they are in the catalogue
+    texts = []
+    for _ in range(searches):
+        word = zipf_words(rng, 1)[0]
+        kind = rng.choice(["word", "prefix", "pair", "title", "author"])
+        if kind == "word":
+            text = word
+        elif kind == "prefix":
+            text = word[:rng.randint(2, len(word) - 1)]  #part way through typing a word
+        elif kind == "pair":
+            text = f"{word} {zipf_words(rng, 1)[0][:rng.randint(2, 6)]}"
+        else:
+            book = db.get_book_data(isbn_for(rng.randrange(rows)))
+            text = book[1] if kind == "title" else book[2]
+        texts.append((kind, text))
+    return texts
+
+
+def bench_search(path, rows, searches, config, rng):#the search box, from common words matching a large share of the books to exact titles
+    db = Database(path)
+    limit = config["search"]["limit"]
+    by_kind = {}
+    latencies = []
+    texts = search_texts(db, rows, searches, rng)
+    started = time.perf_counter()
+    for kind, text in texts:
+        t0 = time.perf_counter()
+        db.search_books(text, limit)
+        latency = time.perf_counter() - t0
+        latencies.append(latency)
+        by_kind.setdefault(kind, []).append(latency)
+    results = {"all": summarize(latencies, time.perf_counter() - started)}
+    results["all"]["p99_target"] = SEARCH_TARGET_MS
+    results["all"]["meets_target"] = results["all"].get("p99_ms", 0) < SEARCH_TARGET_MS
+    for kind, samples in sorted(by_kind.items()):
+        results[kind] = summarize(samples)
+    db.close()
+    return results
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+def bench_render(path, rows, renders, config, rng):#GUI.output_page for prefetched views, including Tk's layout and drawing
+    try:
+        root = tk.Tk()
+    except tk.TclError as error:
+        return {"skipped": f"no display: {error}"}
+    db = CachedDatabase(path)
+    app = ScanApp(root, config)
+    station = Station("benchmark", CameraSession(width=640, height=360), BarcodeDecoder(**config["decode"]))
+    app.stations = [station]
+    app.db = db
+    gui = GUI(root, config, station, app)
+    gui.ready(False)  #no camera, so reset_app goes straight back to the idle page
+    root.update()
+    views = [db.get_book_view(isbn_for(rng.randrange(rows)), config["recommendations"]["count"], "rating") for _ in range(renders)]
+    widgets_before = count_widgets(root)
+    latencies = []
+    started = time.perf_counter()
+    for view in views:
+        t0 = time.perf_counter()
+        gui.barcode_data = view["book"][0]
+        gui.output_page(view)
+        root.update()
+        latencies.append(time.perf_counter() - t0)
+        gui.reset_app()
+        root.update()
+    result = summarize(latencies, time.perf_counter() - started)
+    result["widgets_before"] = widgets_before
+    result["widgets_after"] = count_widgets(root)  #should match, pages reuse their widgets
+    app.close()  #stops the app's search thread and startup pool, closes db and destroys root
+    return result
+
+
+def git_version():#the commit being measured, so saved results can be lined up with versions
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old, new, out=sys.stdout):#percentage change of every latency and throughput figure present in both runs
+    print(f"Comparing {old.get('version')} -> {new.get('version')}", file=out)
+
+    def walk(old_section, new_section, prefix):
+        for key, value in new_section.items():
+            before = old_section.get(key) if isinstance(old_section, dict) else None
+            if isinstance(value, dict):
+                walk(before or {}, value, f"{prefix}{key}.")
+            elif key.endswith("_ms") or key == "per_second":
+                if isinstance(before, (int, float)) and before:
+                    change = (value - before) / before * 100
+                    print(f"  {prefix + key:<40}{before:>12.3f}{value:>12.3f}{change:>+9.1f}%", file=out)
+
+    walk(old.get("results", {}), new.get("results", {}), "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark decode, scan-to-result, lookups and output page rendering")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="catalogue sizes to generate and look books up in")
+    parser.add_argument("--workdir", default=os.path.join(os.path.expanduser("~"), ".cache", "blurb-it", "benchmark"),
+                        help="where generated catalogues are kept between runs, several hundred MB at the default sizes")
+    parser.add_argument("--frames", help="recorded frames to decode instead of synthetic ones, a directory of images or a video")
+    parser.add_argument("--decode-frames", type=int, default=300, help="synthetic frames to decode")
+    parser.add_argument("--blank-ratio", type=float, default=0.2, help="share of synthetic frames with no barcode")
+    parser.add_argument("--scans", type=int, default=100, help="scans replayed through the scan core")
+    parser.add_argument("--fps", type=int, default=30, help="camera rate for the replayed scans, 0 for as fast as possible")
+    parser.add_argument("--lookups", type=int, default=5000, help="lookups per catalogue")
+    parser.add_argument("--searches", type=int, default=2000, help="searches per catalogue")
+    parser.add_argument("--renders", type=int, default=200, help="output pages drawn")
+    parser.add_argument("--skip", default="", help="comma separated benchmarks to skip: decode, pipeline, lookup, search, render")
+    parser.add_argument("--config", help="JSON config file, decode, consensus and recommendation settings are used")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark.json", help="where to save the results")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    skip = {name.strip() for name in args.skip.split(",") if name.strip()}
+    sizes = [int(size) for size in args.sizes.split(",")]
+    rng = random.Random(args.seed)
+    os.makedirs(args.workdir, exist_ok=True)
+    catalogues = {rows: make_catalogue(os.path.join(args.workdir, f"books_v{CATALOGUE_VERSION}_{rows}.db"), rows, rng) for rows in sizes}
+    results = {}
+
+    if "decode" not in skip or "pipeline" not in skip:
+        noise = np.random.default_rng(args.seed)
+        codes = [isbn_for(rng.randrange(min(sizes))) for _ in range(20)]  #in every catalogue, so pipeline lookups are hits
+        frames = {code: synthetic_frame(code, rng=noise) for code in codes}
+        if "decode" not in skip:
+            if args.frames:
+                recorded = load_frames(args.frames)
+                results["decode"] = bench_decode(recorded, [None] * len(recorded), config)
+            else:
+                expected = [None if rng.random() < args.blank_ratio else rng.choice(codes) for _ in range(args.decode_frames)]
+                blank = synthetic_frame(None, rng=noise)
+                results["decode"] = bench_decode([frames[code] if code else blank for code in expected], expected, config)
+            print(f"decode: {results['decode']}", file=sys.stderr)
+        if "pipeline" not in skip:
+            db = CachedDatabase(catalogues[max(sizes)])
+            results["pipeline"] = bench_pipeline(frames, db, config, args.scans, args.fps, rng)
+            db.close()
+            print(f"pipeline: {results['pipeline']}", file=sys.stderr)
+
+    if "lookup" not in skip:
+        for rows, path in catalogues.items():
+            results[f"lookup_{rows}"] = bench_lookups(path, rows, args.lookups, config, rng)
+            print(f"lookup_{rows}: {results[f'lookup_{rows}']}", file=sys.stderr)
+
+    if "search" not in skip:
+        for rows, path in catalogues.items():
+            results[f"search_{rows}"] = bench_search(path, rows, args.searches, config, rng)
+            print(f"search_{rows}: {results[f'search_{rows}']['all']}", file=sys.stderr)
+
+    if "render" not in skip:
+        results["render"] = bench_render(catalogues[min(sizes)], min(sizes), args.renders, config, rng)
+        print(f"render: {results['render']}", file=sys.stderr)
+
+    report = {
+        "version": git_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+    print(f"Saved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor  #pool of lookup threads, backends are mostly waiting on I/O
+
+from isbn import normalise_isbn
+from import_books import RowBuilder, read_records
+
+
+class EnrichmentBackend:#somewhere outside the catalogue that may know a book, subclass and override lookup
+    def lookup(self, isbn):#a dict of book fields (same loose names the importer accepts) or None if unknown
+        raise NotImplementedError
+
+
+class LocalFileBackend(EnrichmentBackend):#books from a local CSV or JSONL file, e.g. a publisher feed dropped on the kiosk
+    def __init__(self, path):
+        self.books = {}
+        for record in read_records(path):
+            fields = {key.lower(): value for key, value in record.items()}
+            isbn = normalise_isbn(fields.get("isbn") or "")
+            if isbn:
+                self.books[isbn] = record
+
+    def lookup(self, isbn):
+        return self.books.get(normalise_isbn(isbn) or str(isbn))
+
+
+class StubBackend(EnrichmentBackend):#canned answers for testing, with an optional delay to stand in for a slow network
+    def __init__(self, books=None, delay=0.0):
+        self.books = {normalise_isbn(isbn) or isbn: fields for isbn, fields in (books or {}).items()}  #ISBN -> dict of book fields
+        self.delay = delay
+        self.calls = 0
+
+    def lookup(self, isbn):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.books.get(normalise_isbn(isbn) or str(isbn))
+
+
+def make_backend(name, path=None):
+    if name == "file":
+        return LocalFileBackend(path)
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"unknown enrichment backend: {name}")
+
+
+class EnrichmentWorker:#resolves unknown ISBNs on a thread pool, saves what it finds and remembers what it doesn't
+    def __init__(self, db, backend, workers=4, negative_ttl=86400):
+        self.db = db
+        self.backend = backend
+        self.negative_ttl = negative_ttl  #seconds a miss is trusted before the backend is asked again
+        self.builder = RowBuilder(db.columns)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrichment")
+        self.pending = {}  #ISBN -> callbacks waiting on the lookup already running for it
+        self.delivering = 0  #lookups whose callbacks are running right now
+        self.lock = threading.Lock()
+
+    def request(self, isbn, callback):#starts a background lookup, returns False straight away if the ISBN is a recent miss
+        #callback gets an (isbn, row or None, error or None) tuple on a worker thread, so GUIs should hand it to their own thread.
+        #row is None when nobody has the book, error is set instead when the lookup itself failed
+        if self.db.is_known_missing(isbn, self.negative_ttl):
+            return False
+        with self.lock:
+            if isbn in self.pending:
+                self.pending[isbn].append(callback)  #scanned again while the first lookup is still running
+                return True
+            self.pending[isbn] = [callback]
+        self.executor.submit(self._resolve, isbn)
+        return True
+
+    def pending_count(self):#lookups that haven't delivered their result yet
+        with self.lock:
+            return len(self.pending) + self.delivering
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _resolve(self, isbn):
+        row = error = None
+        try:
+            record = self.backend.lookup(isbn)
+            if record:
+                record = dict(record)
+                record.setdefault("isbn", isbn)
+                row = self.builder.build(record)
+            if row:
+                self.db.upsert_books([row])
+                row = self.db.get_book_data(row[0])  #read back so the caller gets the same shape as any other row
+            else:
+                self.db.mark_missing(isbn)
+        except Exception as exc:
+            #not marked missing, the backend may well know the book next time
+            print(f"Enrichment lookup for {isbn} failed:", file=sys.stderr)
+            traceback.print_exc()
+            row, error = None, str(exc) or type(exc).__name__
+        finally:
+            with self.lock:
+                callbacks = self.pending.pop(isbn, [])
+                self.delivering += 1  #still counted as pending, so pollers never see no work and no result
+            try:
+                for callback in callbacks:
+                    callback((isbn, row, error))
+            finally:
+                with self.lock:
+                    self.delivering -= 1
@@ -1,34 +1,454 @@
-import cv2  #OpenCV library for webcam access
-import tkinter as tk  #tkinter library for the graphical user interface
-from tkinter import messagebox  #messagebox module for displaying error messages
-from pyzbar.pyzbar import decode  #decode function from pyzbar for reading barcodes
-from PIL import Image, ImageTk  #PIL for image processing
+import time
+PROCESS_STARTED = time.perf_counter()  #startup timing counts from here, see StartupTimer
+import importlib
 import sqlite3
+import sys
+import os
+import re
+import queue  #thread-safe queues for passing frames and results between threads
+import threading  #background threads for webcam capture and barcode decoding
+import json  #config files
+import argparse  #command line flags
+import copy
+import statistics
+import traceback
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from isbn import normalise_isbn
+
+
+class LazyModule:#stands in for a module and imports it on first use, so startup only pays for what it needs straight away
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def import_now(self):#imports the module now, safe from any thread, the import lock makes a second caller wait for the first
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, name):#only runs for names this object lacks, so every module attribute is read live from the module
+        return getattr(self.import_now(), name)
+
+
+#heavy libraries, loaded in the background while the window is already up (see ScanApp) or on first use by other tools
+cv2 = LazyModule("cv2")  #OpenCV library for webcam access
+np = LazyModule("numpy")  #frame buffers, already required by OpenCV
+tk = LazyModule("tkinter")  #tkinter library for the graphical user interface
+messagebox = LazyModule("tkinter.messagebox")  #messagebox module for displaying error messages
+pyzbar = LazyModule("pyzbar.pyzbar")  #decode function from pyzbar for reading barcodes
+Image = LazyModule("PIL.Image")  #PIL for image processing
+ImageTk = LazyModule("PIL.ImageTk")
+asyncio = LazyModule("asyncio")  #the scan core's event loop, see ScanCore
+
+
+#settings used when neither the config file nor a command line flag sets them
+DEFAULT_CONFIG = {
+    "camera": {
+        "device": 0,  #index passed to cv2.VideoCapture
+        "width": 1280,  #requested capture size, None keeps the driver default, the preview uses whatever size is delivered
+        "height": 720,
+        "fps": 30,
+        "fourcc": None,  #e.g. "MJPG", None keeps the driver default
+        "buffer_size": 1,  #CAP_PROP_BUFFERSIZE, small so the decoder never works on stale frames
+    },
+    "decode": {
+        "roi": [0.6, 0.5],
+        "scales": [0.5],
+        "fallback": "full",
+        "fallback_every": 4,
+    },
+    "consensus": {
+        "required_votes": 3,
+        "window": 1.0,
+    },
+    "preview": {
+        "fps": 30,  #target preview rate, independent of the decode rate
+        "show_stats": False,  #overlay achieved FPS and jitter on the preview
+    },
+    #extra scan stations, each {"name": ..., "camera": {...}} with camera settings overriding the "camera" section,
+    #empty means a single station using the "camera" section
+    "stations": [],
+    "startup": {
+        "report": False,  #print how long each startup phase took once every camera shows a frame
+    },
+    "core": {
+        "decode_workers": None,  #decoder threads shared by every station, None means one per core
+        "repeat_cooldown": 3.0,  #headless mode: seconds before the same ISBN is reported again
+    },
+    "recommendations": {
+        "count": 10,  #similar books per page of the Similar Recommendations menu
+        "rank": "rating",  #"rating", "loved" (how many users loved the book) or "similar" (needs recommender.py build)
+    },
+    "search": {
+        "debounce_ms": 200,  #wait this long after the last keystroke before searching
+        "min_chars": 2,
+        "limit": 15,
+    },
+    "enrichment": {
+        "backend": None,  #None, "file" (a CSV/JSONL of books at "path") or "stub"
+        "path": None,
+        "workers": 4,
+        "negative_ttl": 86400,  #seconds before an ISBN nobody knew is looked up again
+    },
+    "database": {
+        "path": "Y13/Booktest.db",
+        "pool_size": 4,  #connections shared by the GUI and worker threads
+        "pragmas": None,  #None uses DEFAULT_PRAGMAS
+        "cache_size": 1024,  #book rows kept in memory
+        "cache_ttl": None,  #seconds before a cached row is re-read, None keeps it until evicted
+        "user_id": "default",  #whose loved books the kiosk shows
+    },
+}
+
+
+def load_config(path=None):#defaults overlaid with the sections of a JSON config file
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path) as config_file:
+            for section, values in json.load(config_file).items():
+                if isinstance(values, dict):
+                    config.setdefault(section, {}).update(values)
+                else:
+                    config[section] = values  #lists such as "stations" replace the default
+    return config
+
+
+def station_configs(config):#(name, camera settings) for each scan station, one "main" station when none are listed
+    stations = config.get("stations") or [{"name": "main"}]
+    result = []
+    for number, station in enumerate(stations, start=1):
+        camera = dict(config["camera"])
+        camera.update(station.get("camera", {}))
+        result.append((station.get("name") or f"station {number}", camera))
+    return result
+
+
+def open_database(config):#the CachedDatabase every station shares, with the similar-books index if that ranking is on
+    db_config = config["database"]
+    db = CachedDatabase(db_config["path"], db_config["pool_size"], db_config["pragmas"],
+                        db_config["cache_size"], db_config["cache_ttl"], db_config["user_id"])
+    if config["recommendations"]["rank"] == "similar":
+        db.recommender = load_recommender(db_config["path"])
+    return db
+
+
+class StartupTimer:#records how long each startup phase took, phases on different threads can overlap
+    def __init__(self, started=None):
+        self.started = PROCESS_STARTED if started is None else started
+        self.phases = []  #(name, start, end) in seconds since started
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def add(self, name, start, end):
+        with self.lock:
+            self.phases.append((name, start - self.started, end - self.started))
+
+    def mark(self, name):#a moment rather than a phase, e.g. the first frame on screen
+        now = time.perf_counter()
+        self.add(name, now, now)
+
+    def report(self):#one line per phase in the order they started
+        lines = [f"{'startup phase':<32}{'start ms':>10}{'end ms':>10}{'took ms':>10}"]
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: (phase[1], phase[2]))
+        for name, start, end in phases:
+            lines.append(f"{name:<32}{start * 1000:10.0f}{end * 1000:10.0f}{(end - start) * 1000:10.0f}")
+        return "\n".join(lines)
+
+
+class ScanApp:#everything the stations share: one database and cache, one ScanCore and enrichment pool, and a window per station
+    def __init__(self, root, config=None, timer=None):
+        self.root = root
+        self.config = config or load_config()
+        self.timer = timer or StartupTimer()
+        self.db = None
+        self.core = None
+        self.enrichment = None
+        self.stations = []
+        self.windows = []  #GUI per station, the first one lives in root
+        self.startup = None  #thread pool for the slow parts of startup
+        self.startup_tasks = []
+        self.searches = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")  #as-you-type searches, kept off the Tk thread
+        self.started = False  #True once the database and at least one camera are up
+        self.closed = False
+        self.waiting_for_frames = set()  #stations that haven't shown their first frame yet
+
+    def start(self):#draws a window per station straight away, the camera, decoder and database open behind it
+        with self.timer.phase("build windows"):
+            for name, camera_config in station_configs(self.config):
+                self.stations.append(Station(name, CameraSession(**camera_config), BarcodeDecoder(**self.config["decode"]),
+                                             ConsensusVoter(**self.config["consensus"])))
+            for number, station in enumerate(self.stations):
+                window = self.root if number == 0 else tk.Toplevel(self.root)
+                window.protocol("WM_DELETE_WINDOW", self.close)
+                self.windows.append(GUI(window, self.config, station, self))
+        self.root.after_idle(self.timer.mark, "window drawn")
+
+        #none of these touch Tk, the results are picked up on the Tk thread by poll_startup
+        self.startup = ThreadPoolExecutor(max_workers=len(self.stations) + 2, thread_name_prefix="startup")
+        self.startup_tasks = [self.startup.submit(self._open_database), self.startup.submit(self._load_libraries)]
+        self.startup_tasks += [self.startup.submit(self._open_camera, station) for station in self.stations]
+        self.root.after(20, self.poll_startup)
+
+    def _open_database(self):
+        with self.timer.phase("open database"):
+            db = open_database(self.config)
+        with self.timer.phase("warm database"):
+            db.warm_up()
+        return db
+
+    def _load_libraries(self):#the imports the first frame and the first decode need
+        with self.timer.phase("load cv2"):
+            cv2.import_now()
+            np.import_now()
+        with self.timer.phase("load pyzbar"):
+            pyzbar.import_now()
+            book_symbols()
+        with self.timer.phase("load PIL"):
+            Image.import_now()
+            ImageTk.import_now()
+        with self.timer.phase("load asyncio"):
+            asyncio.import_now()
+
+    def _open_camera(self, station):
+        cv2.import_now()  #waits for _load_libraries if it is already importing it
+        with self.timer.phase(f"open camera {station.name}"):
+            return station.camera.open()
+
+    def poll_startup(self):#Tk thread: finishes startup once every background task is done
+        if self.closed:
+            return
+        if not all(task.done() for task in self.startup_tasks):
+            self.root.after(20, self.poll_startup)
+            return
+        self.startup.shutdown(wait=False)
+        self.finish_startup()
+
+    def finish_startup(self):
+        database_task, library_task, *camera_tasks = self.startup_tasks
+        try:
+            library_task.result()
+            library_error = None
+        except Exception as error:  #a broken install, nothing can be scanned but the catalogue can still be searched
+            library_error = f"Unable to load the scanning libraries ({error})"
+            print(library_error, file=sys.stderr)
+        try:
+            self.db = database_task.result()
+        except (SchemaError, sqlite3.Error) as error:
+            messagebox.showerror("Error", f"Unable to open the book database: {error}")
+            self.close()
+            return
+
+        opened = []
+        if library_error is None:  #otherwise the camera tasks failed on the same import
+            for station, task in zip(self.stations, camera_tasks):
+                if task.result():
+                    station.camera.start()
+                    opened.append(station)
+                else:
+                    messagebox.showerror("Error", f"Unable to access webcam {station.camera.device} ({station.name}). Make sure it's connected.")
+            if not opened:
+                self.close()
+                return
+
+            #camera, decoder and book lookups run in the asyncio core, the windows only draw what it reports
+            with self.timer.phase("start scan core"):
+                self.core = ScanCore(opened, self.db, self.config["recommendations"], self.config["core"]["decode_workers"])
+                self.core.start()
+        #optional background lookups for ISBNs the catalogue doesn't have
+        self.enrichment = make_enrichment_worker(self.db, self.config["enrichment"])
+        self.waiting_for_frames = {station.name for station in opened}
+        for window in self.windows:
+            window.ready(window.station in opened, library_error)
+        self.started = True
+
+    def frame_shown(self, station):#called by each window on its first frame, the startup report goes out after the last one
+        if station.name not in self.waiting_for_frames:
+            return
+        self.timer.mark(f"first frame {station.name}")
+        self.waiting_for_frames.discard(station.name)
+        if not self.waiting_for_frames and self.config["startup"]["report"]:
+            print(self.timer.report(), file=sys.stderr)
+
+    def close(self):#closing any station window shuts the whole kiosk down
+        self.closed = True
+        for window in self.windows:
+            window.scheduler.stop()
+        if self.startup is not None:
+            self.startup.shutdown(wait=False, cancel_futures=True)
+        self.searches.shutdown(wait=False, cancel_futures=True)
+        if self.enrichment is not None:
+            self.enrichment.shutdown()
+        if self.core is not None:
+            self.core.stop()
+        for station in self.stations:
+            station.camera.close()
+        if self.db is not None:
+            self.db.close()
+        self.root.destroy()
+
+
+class BookDetailView:#the output page, built once and refilled for every book so memory stays flat however many books are viewed
+    def __init__(self, root, on_back, on_love):
+        self.frame = tk.Frame(root)  #packed by the GUI in place of the webcam page
+        self.book_summary = None  #summary and reviews of the book on the page
+        self.book_reviews = {}
+
+        #align the "Back" button to the bottom left corner
+        self.back_button = tk.Button(self.frame, text="Back", command=on_back)
+        self.back_button.pack(side=tk.BOTTOM, anchor=tk.SW, padx=20, pady=20)
+
+        # Button to "love" a book, only placed while a book is showing
+        self.love_book_button = tk.Button(self.frame, text="Love book", command=on_love)
+
+        #shown instead of the details when the ISBN isn't in the database
+        self.message_label = tk.Label(self.frame, text="", font=("Helvetica", 16))
+
+        self.details = tk.Frame(self.frame)
+        #book name, author and genre down the top left
+        self.name_label = tk.Label(self.details, text="", font=("Helvetica", 24))
+        self.name_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=(20, 0))
+        self.author_label = tk.Label(self.details, text="", font=("Helvetica", 18))
+        self.author_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=(5, 0))
+        self.genre_label = tk.Label(self.details, text="", font=("Helvetica", 16))
+        self.genre_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=20)
+
+        #menu button for recommendations, its entries are replaced for each book
+        self.rec_menu_button = tk.Menubutton(self.details, text="Similar Recommendations", relief=tk.RAISED)
+        self.rec_menu_button.pack(side=tk.BOTTOM, padx=20, pady=80)
+        self.rec_menu = tk.Menu(self.rec_menu_button, tearoff=0)
+        self.rec_menu_button['menu'] = self.rec_menu
+
+        #rating and reading time on the right
+        self.rating_label = tk.Label(self.details, text="", font=("Helvetica", 18))
+        self.rating_label.pack(side=tk.TOP, anchor=tk.NE, padx=20, pady=(5, 0))
+        self.pages_label = tk.Label(self.details, text="", font=("Helvetica", 16))
+        self.pages_label.pack(side=tk.TOP, anchor=tk.NE, padx=20, pady=(30, 0))
+
+        # Dropdowns for Summary and Reviews
+        self.summary_button = tk.Button(self.details, text="Summary", command=self.show_summary)
+        self.summary_button.pack(side=tk.TOP, anchor=tk.W, padx=20, pady=(10, 0))
+        self.reviews_var = tk.StringVar(value="Reviews")
+        self.reviews_menu = tk.OptionMenu(self.details, self.reviews_var, "Review 1", "Review 2", "Review 3", "Review 4", command=self.show_review)
+        self.reviews_menu.pack(side=tk.LEFT, anchor=tk.W, padx=20, pady=(10, 0))
+
+        #summary and review text, placed under their buttons when asked for
+        self.summary_label = tk.Label(self.details, text="", font=("Helvetica", 16), wraplength=500, justify='left', anchor='nw')
+        self.review_label = tk.Label(self.details, text="", font=("Helvetica", 16), wraplength=500, justify='left', anchor='nw')
+
+    def show_book(self, book_data):#fills the page in for one books row
+        #unpack book data 
+        isbn, name, author, genre, rating, summary, good_review1, good_review2, bad_review1, bad_review2, pages, loved = book_data
+
+        self.message_label.pack_forget()
+        self.details.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.love_book_button.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-10, y=10)
+        self.love_book_button.lift()  #above the details frame, which was created after it
+        self.set_loved(bool(loved))  #1 if the current user loves this book, otherwise 0
+
+        self.name_label.config(text=name)
+        self.author_label.config(text=f"Author: {author}")
+        self.genre_label.config(text=f"Genre: {genre}")
+
+        # Round the rating to the nearest whole number and generate star emojis
+        rounded_rating = round(min(rating or 0, 5))
+        star_emoji = "\U00002B50"  # Unicode for star emoji
+        self.rating_label.config(text=f"Rating:{star_emoji * rounded_rating}")
+        self.pages_label.config(text=f"Reading Time: {self.calculate_reading_time(pages or 0)}")
+
+        #the previous book's summary or review may still be open
+        self.summary_label.place_forget()
+        self.review_label.place_forget()
+        self.reviews_var.set("Reviews")
+        # Store book data in instance variables for later use
+        self.book_summary = summary
+        self.book_reviews = {'Review 1': good_review1, 'Review 2': good_review2, 'Review 3': bad_review1, 'Review 4': bad_review2}
+
+    def show_message(self, text):#a line of text in place of the details, e.g. the book wasn't found
+        self.details.pack_forget()
+        self.love_book_button.place_forget()
+        self.message_label.config(text=text)
+        self.message_label.pack(side=tk.TOP, padx=20, pady=20)
+
+    def set_loved(self, loved):
+        self.love_book_button.config(text="Unlove Book" if loved else "Love Book", bg="red" if loved else "green")
 
+    def calculate_reading_time(self, total_pages, average_time_per_page= 1.7):#average reading time is 1.7 minutes
+        reading_time = round(total_pages * average_time_per_page)
+        hours = reading_time // 60
+        minutes = reading_time % 60
+        if hours > 0:
+            return f"{hours} hours {minutes} minutes"
+        else:
+            return f"{minutes} minutes"
 
-class GUI:
-    def __init__(self, root):
+    def show_summary(self):#outputs summary button onto page
+        #show_book already loaded the summary, so no need to go back to the DB
+        if self.book_summary is not None:
+            summary_button_y = self.summary_button.winfo_y()
+            summary_button_height = self.summary_button.winfo_height()
+            self.summary_label.config(text=self.book_summary)
+            # Place the summary output below the summary button
+            self.summary_label.place(x=20, y=summary_button_y + summary_button_height + 10, width=800, anchor='nw')
+
+    def show_review(self, select):#outputs reviews button onto page
+        #show_book already loaded the reviews, so no need to go back to the DB
+        if self.book_reviews:
+            reviews_menu_y = self.reviews_menu.winfo_y()
+            reviews_menu_height = self.reviews_menu.winfo_height()
+            self.review_label.config(text=self.book_reviews.get(select, ""))
+            # Place the review output below the reviews dropdown
+            self.review_label.place(x=20, y=reviews_menu_y + reviews_menu_height + 10, width=800, anchor='nw')
+
+
+class GUI:#the window for one station
+    def __init__(self, root, config, station, app):
         self.root = root
-        self.root.title("Blurb-it")  #title of the GUI window
+        self.config = config
+        self.station = station
+        self.app = app
+        self.root.title("Blurb-it" if len(app.stations) == 1 else f"Blurb-it - {station.name}")  #title of the GUI window
         self.root.geometry("1800x1000")  #initial window size
         self.barcode_data = None  #variable to store barcode data
+        self.scanning = False  #True while the webcam page is showing
+        self.camera = station.camera  #opened by ScanApp in the background and shared with the core
+        self.decoder = station.decoder  #ROI/downscaled grayscale decode, see BarcodeDecoder for the fallback policy
+        self.db = None  #set by ready() once ScanApp has opened the database
+        self.enrichment = None
+        #the requested size until the camera is open, None means the driver picks, so fall back to a common default
+        self.preview_size = (self.camera.width or 640, self.camera.height or 480)
+        self.first_frame_shown = False
+        self.scan_error = None  #message from the core's last failed scan, shown on the scan page
+
+        #each page is a frame built once, switching pages just swaps which frame is packed
+        self.scan_page = tk.Frame(root)
+        self.scan_page.pack(fill=tk.BOTH, expand=True)
+        self.book_view = BookDetailView(root, self.reset_app, self.toggle_love_book)
 
         #canvas for displaying webcam feed
-        self.canvas = tk.Canvas(root, width=1280, height=720)
+        self.canvas = tk.Canvas(self.scan_page, width=self.preview_size[0], height=self.preview_size[1])
         self.canvas.pack()
+        self.renderer = None  #one image item and buffer reused for every frame, made by ready() once PIL is loaded
+        self.draw_guide_box()
+        self.stats_item = self.canvas.create_text(10, 10, anchor=tk.NW, fill="yellow", font=("Helvetica", 12), text="")
+        self.stats_shown_at = 0.0
+        self.scheduler = FrameScheduler(root, self.capture_frame, self.config["preview"]["fps"])
 
-        # Open the webcam and check if it's available   
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            messagebox.showerror("Error", "Unable to access the webcam. Make sure it's connected.")
-            self.root.destroy()
-        else:
-            self.capture_frame()
-
-        self.db = Database('Y13/Booktest.db')
+        self.enrichment_results = queue.Queue()  #(isbn, row or None, error or None) from the enrichment workers
+        self.polling_enrichment = False
 
         #label for displaying barcode data
-        self.result_label = tk.Label(root, text="", font=("Helvetica", 20))
+        self.result_label = tk.Label(self.scan_page, text="", font=("Helvetica", 20))
         self.result_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=20)
 
         #button for handling loved books
@@ -36,55 +456,156 @@ class GUI:
         self.lovedbooks_button.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-100, y=10)
 
         #label for displaying the instruction prompt
-        self.instruction_label = tk.Label(root, text="Please display ISBN barcode of book", font=("Helvetica", 16))
+        self.instruction_label = tk.Label(self.scan_page, text="Starting camera...", font=("Helvetica", 16))
         self.instruction_label.pack(side=tk.TOP, pady=(5, 20))
 
 
-        #"Back" button initially hidden
-        self.back_button = tk.Button(root, text="Back", command=self.reset_app)
-        self.back_button.pack(side=tk.BOTTOM, anchor=tk.SW, padx=20, pady=20)
-        self.back_button.pack_forget()
-
+        #search box with as-you-type results, for books without a barcode to hand
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_search_changed)
+        self.search_entry = tk.Entry(root, textvariable=self.search_var, font=("Helvetica", 14))
+        self.search_entry.place(x=20, y=10, width=240)
+        self.search_results = tk.Listbox(root, font=("Helvetica", 12))
+        self.search_results.bind("<<ListboxSelect>>", self.show_search_result)
+        self.search_isbns = []  #ISBN of each row in search_results
+        self.search_after_id = None  #pending debounced search
+        self.search_future = None  #search running on the app's search thread, only the newest one is shown
 
-        
         #menu for loved book button menu
         self.menu = tk.Menu(root, tearoff=0)
         #self.menu.add_command(label="No loved books", command=self.set_option)
-        
-        
-                # Button to "love" a book
-        self.love_book_button = tk.Button(root, text="Love book", command=self.toggle_love_book)
-        self.love_book_button.place(relx=1.0, rely=0.0, anchor = tk.NE, x = -10, y=10)
-        #self.love_book_button.pack(side=tk.TOP, anchor=tk.NE, padx=20, pady=20)
-        self.love_book_button.place_forget()  # Initially hidden
 
+        #these need the database, ready() turns them on once it is open
+        self.lovedbooks_button.config(state=tk.DISABLED)
+        self.search_entry.config(state=tk.DISABLED)
+
+
+    def ready(self, camera_opened, problem=None):#called by ScanApp on the Tk thread once the database, libraries and camera are up
+        self.db = self.app.db
+        self.enrichment = self.app.enrichment
+        self.lovedbooks_button.config(state=tk.NORMAL)
+        self.search_entry.config(state=tk.NORMAL)
+        if not camera_opened:
+            self.instruction_label.config(text=f"{problem or 'Webcam unavailable'}, search for a book instead")
+            return
+        if self.camera.frame_size and all(self.camera.frame_size):
+            self.set_preview_size(self.camera.frame_size)  #what the driver actually delivers, so frames don't need resizing
+        self.renderer = PreviewRenderer(self.canvas, self.preview_size)
+        self.scanning = True
+        self.scheduler.start()  #start the preview once every widget it touches exists
+
+
+    def capture_frame(self):#preview tick run by the scheduler, decoding and lookups happen in the core so this never waits on them
+        if not self.scanning:
+            return  #webcam page is not showing
+
+        event = self.station.get_event()  #("book", station, isbn, view) once the core has confirmed a scan and looked it up
+        if event and event[0] == "error":
+            self.scan_error = event[3]  #shown until the next book, the station is already scanning again
+        elif event:
+            _, _, self.barcode_data, view = event
+            self.scan_error = None
+            self.output_page(view)  #Display the output page with the view the core already fetched
+            return
+
+        if not self.camera.connected.is_set():
+            #the session keeps retrying in the background, just tell the user
+            self.instruction_label.config(text="Webcam disconnected, reconnecting...")
+        elif self.scan_error:
+            self.instruction_label.config(text=f"Scan failed: {self.scan_error}, please try again")
+        else:
+            self.instruction_label.config(text="Please display ISBN barcode of book")
+            frame = self.camera.take_frame()  #None when no new frame arrived since the last tick
+            if frame is not None:
+                self.renderer.draw(frame)  #Display the webcam feed on the canvas
+                if not self.first_frame_shown:
+                    self.first_frame_shown = True
+                    self.app.frame_shown(self.station)
+            if self.config["preview"]["show_stats"]:
+                self.show_preview_stats()
+
+
+    def show_preview_stats(self):#refreshes the FPS/jitter overlay about once a second
+        now = time.perf_counter()
+        if now - self.stats_shown_at < 1.0:
+            return
+        self.stats_shown_at = now
+        fps, jitter = self.scheduler.stats()
+        cache = self.db.cache_stats()
+        voter = self.station.voter
+        confirm = "confirm -"
+        if voter is not None and voter.confirmed:
+            confirm = f"confirm {voter.last_latency * 1000:.0f} ms, avg {voter.average_latency() * 1000:.0f} ms over {voter.confirmed}"
+        if fps:
+            self.canvas.itemconfig(self.stats_item, text=f"{fps:.1f} fps, jitter {jitter * 1000:.1f} ms, skipped {self.scheduler.skipped}\n"
+                                                         f"cache {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions\n"
+                                                         f"{confirm}")
+
+
+    def on_search_changed(self, *args):#debounce: only search once typing pauses
+        self.search_future = None  #whatever is still running is for text that has changed
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.config["search"]["debounce_ms"], self.run_search)
+
+
+    def run_search(self):#the query runs on the search thread so typing never waits on the database
+        self.search_after_id = None
+        text = self.search_var.get().strip()
+        if len(text) < self.config["search"]["min_chars"]:  #one-letter prefixes match half the catalogue
+            self.show_search_results([])
+            return
+        self.search_future = self.app.searches.submit(self.db.search_books, text, self.config["search"]["limit"])
+        self.root.after(20, self.poll_search, self.search_future)
+
+
+    def poll_search(self, future):#Tk thread: shows a search's results once it finishes, unless newer typing replaced it
+        if future is not self.search_future:
+            return
+        if not future.done():
+            self.root.after(20, self.poll_search, future)
+            return
+        self.search_future = None
+        try:
+            results = future.result()
+        except sqlite3.Error:
+            results = []  #e.g. FTS5 syntax the quoting didn't catch, no results is the honest answer
+        self.show_search_results(results)
+
+
+    def show_search_results(self, results):
+        self.search_results.delete(0, tk.END)
+        self.search_isbns = [isbn for isbn, _, _, _ in results]
+        for isbn, name, author, snippet in results:
+            self.search_results.insert(tk.END, f"{name} - {author}: {snippet}")
+        if results:
+            self.search_results.place(x=20, y=40, width=240, height=min(len(results), 15) * 22)
+            self.search_results.lift()
+        else:
+            self.search_results.place_forget()
 
-        
 
-    def capture_frame(self):
-        ret, frame = self.cap.read()  #Capture a frame from the webcam
+    def show_search_result(self, event):#callback for clicking a search result
+        selection = self.search_results.curselection()
+        if not selection:
+            return
+        self.barcode_data = self.search_isbns[selection[0]]
+        self.search_var.set("")
+        self.output_page()
 
-        if self.barcode_data is None:
-            if ret:
-                barcodes = decode(frame)  #Decode barcodes in the frame
-                if barcodes:
-                    self.barcode_data = barcodes[0].data.decode("utf-8")  #Store barcode data
 
-        if self.barcode_data:
-            self.output_page()  #Display the output page if barcode data is available
-        else:
-            if ret:
-                #Display the webcam feed on the canvas
-                img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = cv2.resize(img, (1280, 720))
-                img = Image.fromarray(img)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.canvas.imgtk = imgtk
-                self.canvas.create_image(0, 0, anchor=tk.NW, image=imgtk)
-                self.canvas.update()
-                self.root.after(10, self.capture_frame)
-            else:
-                self.root.quit()  #Quit the application if the webcam not available
+    def set_preview_size(self, size):
+        if tuple(size) == self.preview_size:
+            return
+        self.preview_size = tuple(size)
+        self.canvas.config(width=size[0], height=size[1])
+        self.canvas.delete("guide")
+        self.draw_guide_box()
+
+
+    def draw_guide_box(self):#outlines the area the decoder scans first so users know where to hold the barcode
+        x1, y1, x2, y2 = self.decoder.roi_box(*self.preview_size)
+        self.canvas.create_rectangle(x1, y1, x2, y2, outline="lime green", width=3, tags="guide")
 
 
     def handle_loved_menu(self): #determines the result of clicking the button
@@ -109,17 +630,9 @@ class GUI:
 
     def toggle_love_book(self):
         if self.barcode_data:
-            #toggle the loved status in the database
-            self.db.toggle_loved_status(self.barcode_data)
-          
-
-        # Fetch the updated book data
-        book_data = self.db.get_book_data(self.barcode_data)
-        if book_data:
-            _, _, _, _, _, _, _, _, _, _, _, loved = book_data
-            loved_status = loved == "True"  #database stores "True" or "False" as strings
-            self.love_book_button.config(text="Unlove Book" if loved_status else "Love Book",
-                                         bg="red" if loved_status else "green")
+            #toggle the loved status in the database, it hands back the new state so there is nothing to re-fetch
+            loved_status = self.db.toggle_loved_status(self.barcode_data)
+            self.book_view.set_loved(loved_status)
             
       
 
@@ -137,317 +650,1300 @@ class GUI:
 
 
 
-    def display_rec_books(self, genre, current_book_name):#procedure for managing the result of clicking the recommended books
-        self.rec_menu.delete(0, tk.END)
-        rec_books = self.db.get_books_by_genre(genre)
+    def display_rec_books(self, rec_books, cursor, genre, current_isbn, source):#procedure for managing the result of clicking the recommended books
+        self.book_view.rec_menu.delete(0, tk.END)
         if not rec_books:
-            self.rec_menu.add_command(label="No similar books found", state=tk.DISABLED)
+            self.book_view.rec_menu.add_command(label="No similar books found", state=tk.DISABLED)
         else:
-            for book_name in rec_books:
-                if book_name != current_book_name:  #skip the current book
-                    self.rec_menu.add_command(
-                        label=book_name,
-                        command=lambda b=book_name: self.prepare_and_show_book(b)
-                    )
+            self.add_rec_page(rec_books, cursor, genre, current_isbn, source)
 
 
-    def prepare_and_show_book(self, book_name):#callback function for recommended books
-        # Fetch book data by name
-        book_data = self.db.get_book_data_by_name(book_name)
-        if book_data:
-            # Clear the current output page
-            self.clear_output_page()
-            # Unpack the book data
-            isbn, _, _, _, _, _, _, _, _, _, _, _ = book_data
-            # Set the barcode data to the ISBN of the selected book
-            self.barcode_data = isbn
-            # Call output_page to display the book information
-            self.output_page()
-        else:
-            messagebox.showerror("Error", "Book not found in the database.")
+    def add_rec_page(self, rec_books, cursor, genre, current_isbn, source):#appends one page of recommendations, plus "More..." if there is another
+        for isbn, book_name in rec_books:
+            self.book_view.rec_menu.add_command(
+                label=book_name,
+                command=lambda i=isbn: self.prepare_and_show_book(i)
+            )
+        if cursor is not None:
+            self.book_view.rec_menu.add_command(label="More...",
+                                      command=lambda: self.load_more_recs(cursor, genre, current_isbn, source))
 
 
-            
-
-    def calculate_reading_time(self, total_pages, average_time_per_page= 1.7):#average reading time is 1.7 minutes
-   
-        reading_time = round(total_pages * average_time_per_page)
-
-
-        hours = reading_time // 60
-        minutes = reading_time % 60
-
-        if hours > 0:
-            return f"{hours} hours {minutes} minutes"
+    def load_more_recs(self, cursor, genre, current_isbn, source):#fetches the next page only when asked, so big genres cost nothing up front
+        count = self.config["recommendations"]["count"]
+        if source == "similar":
+            rec_books, next_cursor = self.db.get_similar_books(current_isbn, count, cursor)
         else:
-            return f"{minutes} minutes"
-
+            rec_books, next_cursor = self.db.get_books_by_genre(genre, count, cursor, current_isbn, source)
+        view = self.book_view
+        view.rec_menu.delete(tk.END)  #the "More..." entry that was clicked
+        self.add_rec_page(rec_books, next_cursor, genre, current_isbn, source)
+        #clicking an entry closes the menu, so open it again where it was
+        view.rec_menu.post(view.rec_menu_button.winfo_rootx(),
+                           view.rec_menu_button.winfo_rooty() + view.rec_menu_button.winfo_height())
 
-    def clear_output_page(self):
-        #clears all the widgets from the output page
-        for widget in self.root.pack_slaves():
-            widget.pack_forget()
-        for widget in self.root.place_slaves():
-            widget.place_forget()
 
-    def output_page(self):#main method for outputting information onto my frame
+    def prepare_and_show_book(self, isbn):#callback function for recommended books
+        # Set the barcode data to the ISBN of the selected book
+        self.barcode_data = isbn
+        # Call output_page to display the book information
+        self.output_page()
 
-        self.clear_output_page()#clear page
-
-        #Close webcam, destroy canvas, hide menu, show "Back" button, and display the barcode data
-        self.cap.release()
-        cv2.destroyAllWindows()
-        self.canvas.destroy()
-        self.lovedbooks_button.place_forget()
-        self.instruction_label.pack_forget()
-        #align the "Back" button to the bottom left corner
-        self.back_button.pack(side=tk.BOTTOM, anchor=tk.SW, padx=20, pady=20)
-
-
-         #fetch book data from DB by using ISBN
-        book_data = self.db.get_book_data(self.barcode_data)
-
-        if book_data:
-
-            #show the "Love Book" button
-            self.love_book_button.place(relx=1.0, rely=0.0, anchor = tk.NE, x = -10, y=10)
-
-            #unpack book data 
-            isbn, name, author, genre, rating, summary, good_review1, good_review2, bad_review1, bad_review2, pages, loved = book_data
 
-
-             #check the "Loved" status and set button label initially
-            loved_status = loved == "True"  #True if loved is "True", otherwise False
-            self.love_book_button.config(text="Unlove Book" if loved_status else "Love Book",
-                                     bg="red" if loved_status else "green")
-            #self.love_book_button.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-10, y=10)  # Make sure to place it again
-
-
-             #display book name
-            self.name_label = tk.Label(self.root, text=name, font=("Helvetica", 24))
-            self.name_label.pack(side=tk.TOP, anchor=tk.NW, padx= 20, pady=(20, 0))
-
-            #display author
-            self.author_label = tk.Label(self.root, text=f"Author: {author}", font=("Helvetica", 18))
-            self.author_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=(5, 0))
-
-
-             #display genre at the top under author
-            self.genre_label = tk.Label(self.root, text=f"Genre: {genre}", font=("Helvetica", 16))
-            self.genre_label.pack(side=tk.TOP, anchor= tk.NW,  padx=20, pady=20)
-
-            #create the menu button for recommendations
-            self.rec_menu_button = tk.Menubutton(self.root, text="Similar Recommendations", relief=tk.RAISED)
-            self.rec_menu_button.pack(side=tk.BOTTOM, padx=20, pady=80)
-            self.rec_menu= tk.Menu(self.rec_menu_button, tearoff=0)
-            self.rec_menu_button['menu'] = self.rec_menu
-
-
-
-            # Round the rating to the nearest whole number and generate star emojis
-            if rating>5:
-                rating = 5
-            rounded_rating = round(rating)
-            star_emoji = "\U00002B50"  # Unicode for star emoji
-            stars_display = star_emoji * rounded_rating
-
-            # Display rating with star emojis
-            self.rating_label = tk.Label(self.root, text=f"Rating:{stars_display}", font=("Helvetica", 18))
-            self.rating_label.pack(side=tk.TOP, anchor=tk.NE, padx=20, pady=(5, 0))
             
 
+    def show_scan_page(self):
+        self.book_view.frame.pack_forget()
+        self.scan_page.pack(fill=tk.BOTH, expand=True)
+        self.lovedbooks_button.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-100, y=10)
+        self.lovedbooks_button.lift()
+        self.search_entry.place(x=20, y=10, width=240)
+        self.search_entry.lift()
 
-            # Calculate and display reading time
-            reading_time_text = self.calculate_reading_time(pages)
-            self.pages_label = tk.Label(self.root, text=f"Reading Time: {reading_time_text}", font=("Helvetica", 16))
-            self.pages_label.pack(side=tk.TOP, anchor=tk.NE, padx=20, pady=(30, 0))
-
-
-            currentname = book_data[1]#getting the name of the current book
-            #show similar books based on genre
-            self.display_rec_books(genre, currentname)
-
-
-            # Dropdown for Summary
-            self.summary_button = tk.Button(self.root, text="Summary", command=self.show_summary)
-            self.summary_button.pack(side=tk.TOP,anchor = tk.W, padx=20, pady=(10, 0))
-
-            # Dropdown for Reviews
-            self.reviews_var = tk.StringVar(value = "Reviews", name = "Reviews")
-            self.reviews_menu = tk.OptionMenu(self.root, self.reviews_var, "Review 1", "Review 2", "Review 3", "Review 4", command=self.show_review)
-            self.reviews_menu.pack(side=tk.LEFT,anchor = tk.W, padx=20, pady=(10, 0))
-
-            # Initialize labels for summary and reviews, but do not pack them yet
-
-
-            #self.summary_label = tk.Label(self.root, text="", font=("Helvetica", 16))
-            self.summary_label = tk.Label(self.root, text="", font=("Helvetica", 16), wraplength=500, justify='left', anchor='nw')
 
-            #self.review_label = tk.Label(self.root, text="", font=("Helvetica", 16))
-            self.review_label = tk.Label(self.root, text="", font=("Helvetica", 16), wraplength=500, justify='left', anchor='nw')
+    def show_book_page(self):
+        self.scan_page.pack_forget()
+        self.lovedbooks_button.place_forget()
+        self.search_entry.place_forget()
+        self.search_results.place_forget()
+        self.book_view.frame.pack(fill=tk.BOTH, expand=True)
 
 
-            # Store book data in instance variables for later use
-            self.book_summary = summary
-            self.book_reviews = {'Review 1': good_review1, 'Review 2': good_review2, 'Review 3': bad_review1, 'Review 4': bad_review2}
+    def output_page(self, view=None):#main method for outputting information onto my frame, fetches the view unless the core already did
 
+        #Pause decoding (the webcam stays open) and swap the webcam page for the book page
+        self.scanning = False
+        self.scheduler.stop()
+        self.station.pause()
+        self.show_book_page()
 
+         #fetch the book, its recommendations and its loved state from the DB in one go
+        if view is None:
+            rec_config = self.config["recommendations"]
+            view = self.db.get_book_view(self.barcode_data, rec_config["count"], rec_config["rank"])
+        book_data = view["book"]
 
-            
-           
-           
+        if book_data:
+            #refill the page's widgets with this book
+            self.book_view.show_book(book_data)
+            #show similar books based on genre, the current book is already left out
+            isbn, genre = book_data[0], book_data[3]
+            self.display_rec_books(view["recommendations"], view["next_cursor"], genre, isbn, view["source"])
 
         else:# if there is no ISBN matching to the scanned one in the database
-            # ISBN not found in the database
-            self.book_info_label = tk.Label(self.root, text="Book not found in the database.", font=("Helvetica", 16))
-            self.book_info_label.pack(side=tk.TOP, padx=20, pady=20)
-        #self.result_label.config(text=f"ISBN Data:\n{self.barcode_data}", font=("Helvetica", 20))
-        #self.result_label.pack(side=tk.TOP, anchor=tk.NW, padx=20, pady=20)
-
+            # ISBN not found in the database, ask the enrichment backend in the background if there is one
+            if self.enrichment is not None and self.enrichment.request(self.barcode_data, self.enrichment_results.put):
+                text = "Book not in the database yet, looking it up..."
+                if not self.polling_enrichment:
+                    self.poll_enrichment()
+            else:
+                text = "Book not found in the database."
+            self.book_view.show_message(text)
 
 
     
     
-    def show_summary(self):#outputs summary button onto page
-        #fetch book data from DB by using ISBN
-        book_data = self.db.get_book_data(self.barcode_data)
-
-        if book_data:
-            # Assuming self.summary_button.y is the y-coordinate of the Summary button
-            summary_button_y = self.summary_button.winfo_y()
-            summary_button_height = self.summary_button.winfo_height()
-            self.summary_label.config(text=self.book_summary)
-            # Place the summary output below the summary button
-            self.summary_label.place(x=20, y=summary_button_y + summary_button_height + 10, width=800, anchor='nw')
-        
-
-
-    def show_review(self, select):#outputs reviews button onto page
-
-        #fetch book data from DB by using ISBN
-        book_data = self.db.get_book_data(self.barcode_data)
-
-        if book_data:
-            # Assuming self.reviews_menu.y is the y-coordinate of the Reviews dropdown
-            reviews_menu_y = self.reviews_menu.winfo_y()
-            reviews_menu_height = self.reviews_menu.winfo_height()
-            selected_review = self.book_reviews.get(select, "")
-            self.review_label.config(text=selected_review)
-            # Place the review output below the reviews dropdown
-            self.review_label.place(x=20, y=reviews_menu_y + reviews_menu_height + 10, width=800, anchor='nw')
-    
-
-
-    def reset_app(self):#clear the output page and revert back to state of webcam page
-        
+    def poll_enrichment(self):#picks up finished lookups on the Tk thread, the worker threads never touch widgets
+        while True:
+            try:
+                isbn, row, error = self.enrichment_results.get_nowait()
+            except queue.Empty:
+                break
+            if isbn != self.barcode_data or self.scanning:
+                continue  #the user has moved on, the result is still saved for next time
+            if row:
+                self.output_page()  #redraw with the new book in place of the "looking it up" message
+            elif error:
+                self.book_view.show_message(f"Book not in the database, and looking it up failed: {error}")
+            else:
+                self.book_view.show_message("Book not found in the database.")
+        self.polling_enrichment = self.enrichment.pending_count() > 0
+        if self.polling_enrichment:
+            self.root.after(100, self.poll_enrichment)
 
-        # Destroy all widgets created in 'output_page'
-        for widget in self.root.pack_slaves():
-            widget.pack_forget()
-        for widget in self.root.place_slaves():
-            widget.place_forget()
 
-     
-        # Reset barcode data and recreate the canvas and webcam feed
+    def reset_app(self):#hide the output page and revert back to state of webcam page
+        # Reset barcode data and show the webcam page again, its widgets were only hidden
         self.barcode_data = None
-        self.canvas = tk.Canvas(self.root, width=1280, height=720)
-        self.canvas.pack()
-        self.instruction_label.pack(side=tk.TOP, pady=(5, 20))
-        self.lovedbooks_button.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-100, y=10)
-        self.lovedbooks_button.lift() 
-
-        # Restart webcam feed
-        self.cap = cv2.VideoCapture(0)
-        self.capture_frame()
-
+        self.show_scan_page()
+        if self.renderer is None:
+            return  #this station's webcam never opened, stay on the search-only page
+
+        # Resume decoding straight away, the webcam was never closed
+        self.station.resume()
+        self.scanning = True
+        self.scheduler.start()
+
+
+
+
+#only search for the symbologies printed on books, zbar skips the other decoders entirely
+BOOK_SYMBOLS = None  #barcode types an ISBN can come in, filled in by book_symbols() once pyzbar is loaded
+
+
+def book_symbols():
+    global BOOK_SYMBOLS
+    if BOOK_SYMBOLS is None:
+        #no UPC-A: the UPCs on some paperbacks encode a price code rather than the ISBN, normalise_isbn would reject every one
+        BOOK_SYMBOLS = [pyzbar.ZBarSymbol.EAN13, pyzbar.ZBarSymbol.ISBN10, pyzbar.ZBarSymbol.ISBN13]
+    return BOOK_SYMBOLS
+
+
+def read_barcode(frame):#decodes a frame and returns the first valid ISBN as ISBN-13, or None
+    for barcode in pyzbar.decode(frame, symbols=book_symbols()):  #Decode barcodes in the frame
+        isbn = normalise_isbn(barcode.data.decode("utf-8"))
+        if isbn:
+            return isbn
+    return None
+
+
+class BarcodeDecoder:#grayscale decoder that tries cheap passes first and only falls back to the full frame when they miss
+    def __init__(self, roi=(0.6, 0.5), scales=(0.5,), fallback="full", fallback_every=4):
+        self.roi = roi  #(width, height) of the centred guide box as fractions of the frame, None to use the whole frame
+        self.scales = scales  #downscale ladder for the fast passes, tried in order
+        self.fallback = fallback  #"full" decodes the full-resolution frame when the fast passes miss, "none" never does
+        self.fallback_every = fallback_every  #only run the full-resolution pass on every Nth miss to keep idle frames cheap
+        self.misses = 0
+
+    def __call__(self, frame):#returns the first valid ISBN as ISBN-13, or None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  #convert once, every pass works on this
+        region = self.roi_region(gray)
+        for scale in self.scales:
+            data = self._decode_pass(region, scale)
+            if data:
+                self.misses = 0
+                return data
+
+        self.misses += 1
+        if self.fallback == "full" and self.misses >= self.fallback_every:
+            self.misses = 0
+            return self._decode_pass(gray, 1.0)
+        return None
+
+    def roi_box(self, width, height):#pixel box (x1, y1, x2, y2) of the centred guide box for a frame or canvas size
+        if self.roi is None:
+            return 0, 0, width, height
+        roi_width = int(width * self.roi[0])
+        roi_height = int(height * self.roi[1])
+        x1 = (width - roi_width) // 2
+        y1 = (height - roi_height) // 2
+        return x1, y1, x1 + roi_width, y1 + roi_height
+
+    def roi_region(self, gray):#crops the guide box out of a grayscale frame without copying it
+        height, width = gray.shape[:2]
+        x1, y1, x2, y2 = self.roi_box(width, height)
+        return gray[y1:y2, x1:x2]
+
+    def _decode_pass(self, image, scale):
+        if scale != 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return read_barcode(image)
+
+
+class ConsensusVoter:#only confirms an ISBN once enough reads agree on it within a short time window
+    def __init__(self, required_votes=3, window=1.0):
+        self.required_votes = required_votes  #agreeing reads needed before a result is committed
+        self.window = window  #seconds a read counts towards a vote
+        self.votes = deque()  #(time, isbn) of recent reads, oldest first
+        self.last_latency = None  #seconds from the first agreeing read to confirmation, for tuning
+        self.confirmed = 0
+        self.total_latency = 0.0
+        self.lock = threading.Lock()  #reads are added on the core's loop, reset() comes from the front-end's thread
+
+    def add(self, isbn, now=None):#records a read, returns the ISBN once it is confirmed, otherwise None
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self.votes.append((now, isbn))
+            while self.votes and now - self.votes[0][0] > self.window:
+                self.votes.popleft()  #forget reads that are too old to count
+
+            agreeing = [read_time for read_time, code in self.votes if code == isbn]
+            if len(agreeing) < self.required_votes:
+                return None
+            self.last_latency = now - agreeing[0]
+            self.confirmed += 1
+            self.total_latency += self.last_latency
+            self.votes.clear()
+            return isbn
+
+    def average_latency(self):#mean confirmation time so far, None before the first confirmation
+        if not self.confirmed:
+            return None
+        return self.total_latency / self.confirmed
+
+    def reset(self):
+        with self.lock:
+            self.votes.clear()
+
+
+class FrameScheduler:#calls a Tk callback at a target frame rate, skipping ticks instead of drifting when it falls behind
+    def __init__(self, root, callback, fps=30):
+        self.root = root
+        self.callback = callback
+        self.interval = 1.0 / fps  #seconds between ticks
+        self.after_id = None  #pending root.after call, None when nothing is scheduled
+        self.running = False
+        self.next_tick = 0.0  #perf_counter time the next tick is due
+        self.last_tick = None
+        self.intervals = deque(maxlen=120)  #recent tick-to-tick times for stats()
+        self.skipped = 0  #ticks dropped because a callback overran
+
+    def start(self):
+        if self.running:
+            return  #one tick chain only, even if start is called twice
+        self.running = True
+        self.last_tick = None
+        self.intervals.clear()
+        self.next_tick = time.perf_counter()
+        self._schedule()
+
+    def stop(self):
+        self.running = False
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def stats(self):#(achieved fps, jitter in seconds) over the recent ticks, (None, None) before there are any
+        if len(self.intervals) < 2:
+            return None, None
+        return 1.0 / statistics.mean(self.intervals), statistics.pstdev(self.intervals)
+
+    def _schedule(self):
+        delay = max(0.0, self.next_tick - time.perf_counter())
+        self.after_id = self.root.after(int(delay * 1000), self._tick)
+
+    def _tick(self):
+        self.after_id = None
+        now = time.perf_counter()
+        if self.last_tick is not None:
+            self.intervals.append(now - self.last_tick)
+        self.last_tick = now
+
+        self.callback()
+        if not self.running:
+            return  #the callback stopped the scheduler
+
+        self.next_tick += self.interval
+        behind = time.perf_counter() - self.next_tick
+        if behind > 0:
+            #skip the ticks we missed rather than running them back to back
+            missed = int(behind / self.interval) + 1
+            self.next_tick += missed * self.interval
+            self.skipped += missed
+        self._schedule()
+
+
+class PreviewRenderer:#draws webcam frames into a single canvas image, updating the same buffers in place every frame
+    def __init__(self, canvas, size):
+        self.canvas = canvas
+        self.size = size  #(width, height) of the preview
+        self.resized = None  #BGR buffer at preview size, only allocated if the camera delivers another size
+        #RGBA rather than RGB because PIL only shares memory with the array for 4-byte pixel modes
+        self.rgba = np.empty((size[1], size[0], 4), dtype=np.uint8)
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        self.photo = ImageTk.PhotoImage(image=self.image)
+        self.item = canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+        canvas.tag_lower(self.item)  #overlays such as the guide box stay above the video
+
+    def draw(self, frame):
+        if frame.shape[1::-1] != self.size:  #only resize if the camera ignored the requested size
+            if self.resized is None:
+                self.resized = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+            cv2.resize(frame, self.size, dst=self.resized)
+            frame = self.resized
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self.rgba)  #writes straight into the buffer self.image wraps
+        self.photo.paste(self.image)
+
+
+class CameraSession:#keeps the webcam open for the whole session and reopens it if reads start failing
+    def __init__(self, device=0, width=None, height=None, fps=None, fourcc=None, buffer_size=None,
+                 queue_size=2, retry_delay=0.5, max_retry_delay=5.0):
+        self.device = device  #index passed to cv2.VideoCapture
+        self.width = width  #requested capture settings, None leaves the driver default
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.frame_size = None  #size the driver actually delivers, known once the device is open
+        self.cap = None
+        self.frames = queue.Queue(maxsize=queue_size)  #bounded so the decoder can never fall far behind
+        self.latest_frame = None  #newest frame for the preview, separate from the decode queue
+        self.frame_lock = threading.Lock()
+        self.running = threading.Event()
+        self.connected = threading.Event()  #cleared while the webcam is being reopened
+        self.feeding = threading.Event()  #set while the decoder wants frames
+        self.retry_delay = retry_delay  #first wait before reopening, doubled after each failed attempt
+        self.max_retry_delay = max_retry_delay
+        self.reconnects = 0
+        self.thread = None
+
+    def open(self):#opens the device, returns False if it is not available
+        cap = cv2.VideoCapture(self.device)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        self._apply_settings(cap)
+        self.cap = cap
+        self.connected.set()
+        return True
+
+    def _apply_settings(self, cap):#drivers silently ignore what they don't support, so read the real size back
+        if self.fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))  #has to come before the size on most drivers
+        if self.width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        self.frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.cap is not None:
+            self.cap.release()
+        self.connected.clear()
+
+    def take_frame(self):#returns the newest frame once, None if nothing new arrived
+        with self.frame_lock:
+            frame = self.latest_frame
+            self.latest_frame = None
+        return frame
+
+    def next_frame(self, timeout):#waits for a decode frame and returns the newest one, None on timeout
+        try:
+            frame = self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        #skip to the newest queued frame, older ones are already stale
+        while True:
+            try:
+                frame = self.frames.get_nowait()
+            except queue.Empty:
+                return frame
+
+    def clear_frames(self):
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+
+    def _capture_loop(self):
+        while self.running.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self._reconnect()
+                continue
+            with self.frame_lock:
+                self.latest_frame = frame
+            if not self.feeding.is_set():
+                continue
+            try:
+                self.frames.put_nowait(frame)
+            except queue.Full:
+                #decoder is busy, drop the oldest frame to make room for this one
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    self.frames.put_nowait(frame)
+                except queue.Full:
+                    pass
+
+    def _reconnect(self):#keeps trying to reopen the device with a growing delay until it works or the session closes
+        self.connected.clear()
+        self.cap.release()
+        delay = self.retry_delay
+        while self.running.is_set():
+            time.sleep(delay)
+            if self.open():
+                self.reconnects += 1
+                return
+            delay = min(delay * 2, self.max_retry_delay)
+
+
+class Station:#one scan counter: its own camera, decode state and results, served by a ScanCore shared with the other stations
+    def __init__(self, name, camera, decoder, voter=None, events=None, auto_resume=False, repeat_cooldown=3.0):
+        self.name = name
+        self.camera = camera
+        self.decoder = decoder  #per station, its fallback policy counts this camera's misses
+        self.voter = voter  #optional ConsensusVoter, without one every read is a result
+        #("book", station name, isbn, view) for whoever shows this station, the GUI polls it on its preview tick,
+        #or ("error", station name, isbn or None, message) when decoding or a lookup failed
+        self.events = events if events is not None else queue.Queue()
+        self.auto_resume = auto_resume  #keep scanning after a confirmed read instead of pausing, for headless use
+        self.repeat_cooldown = repeat_cooldown  #with auto_resume, seconds before the same ISBN is reported again
+        self.reported = {}  #ISBN -> when it was last reported
+        self.frames = None  #newest frame waiting for a decoder, an asyncio.Queue made on the core's loop
+
+    def pause(self):#stops feeding frames to the decoder, the webcam keeps running
+        self.camera.feeding.clear()
+
+    def resume(self):#starts a fresh scan, nothing from before the pause can count towards it
+        self.camera.clear_frames()
+        if self.voter is not None:
+            self.voter.reset()
+        while self.get_event() is not None:
+            pass
+        self.camera.feeding.set()
+
+    def get_event(self):#returns the next event without blocking, None if there is none yet
+        try:
+            return self.events.get_nowait()
+        except queue.Empty:
+            return None
+
+    def confirm(self, isbn):#turns a decoded read into a result to look up, None until it should be reported
+        if isbn and self.voter is not None:
+            isbn = self.voter.add(isbn)
+        if not isbn or not self.camera.feeding.is_set():
+            return None  #nothing confirmed yet, or the read finished after a pause
+        if self.auto_resume:
+            now = time.monotonic()
+            if now - self.reported.get(isbn, -self.repeat_cooldown) < self.repeat_cooldown:
+                return None  #the same book is still in front of the camera
+            self.reported[isbn] = now
+        else:
+            self.pause()  #one book at a time, the front-end resumes when it goes back to scanning
+        return isbn
+
+
+ERROR_RETRY_DELAY = 0.5  #seconds a station's producer waits after its camera raised
+
+
+class ScanCore:#asyncio application core: camera producers, decode consumers and book lookups for every station, with no Tk in it
+    def __init__(self, stations, db, rec_config, decode_workers=None):
+        self.stations = stations
+        self.db = db  #lookup service shared by every station, a CachedDatabase keeps repeat scans off the disk
+        self.rec_config = rec_config  #"count" and "rank" of the recommendations fetched with each book
+        self.decode_workers = decode_workers or os.cpu_count() or 1
+        #one decode pool for all the stations, pyzbar and OpenCV release the GIL so it scales with cores
+        self.executor = ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="decode")
+        #blocking camera waits and database lookups, kept apart so they never queue behind decodes
+        self.io_executor = ThreadPoolExecutor(max_workers=len(stations) + 2, thread_name_prefix="scan-io")
+        self.loop = None
+        self.stopping = None
+        self.ready = threading.Event()  #set once the loop is running and stop() can reach it
+        self.thread = None
+
+    def start(self):#runs the core on a background thread so the caller's own loop (e.g. Tk) keeps going
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def run(self):#runs the core on the calling thread until stop() is called
+        try:
+            asyncio.run(self._main())
+        finally:
+            self.ready.set()  #don't leave start() waiting if the loop failed to come up
+
+    def stop(self):#safe to call from any thread
+        for station in self.stations:
+            station.pause()
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.stopping.set)
+            except RuntimeError:
+                pass  #the loop closed between the check and the call
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.io_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        #a station gets an equal share of the decoders, and always at least one
+        consumers = max(1, self.decode_workers // max(len(self.stations), 1))
+        tasks = []
+        for station in self.stations:
+            station.frames = asyncio.Queue(maxsize=1)  #only ever the newest frame, older ones are stale by the time a decoder is free
+            tasks.append(asyncio.create_task(self._produce(station)))
+            tasks += [asyncio.create_task(self._consume(station)) for _ in range(consumers)]
+            station.camera.feeding.set()
+        self.ready.set()
+        await self.stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _produce(self, station):#moves frames from a station's capture thread into the loop
+        while True:
+            try:
+                frame = await self.loop.run_in_executor(self.io_executor, station.camera.next_frame, 0.1)
+            except Exception as error:
+                self._report(station, None, error)
+                await asyncio.sleep(ERROR_RETRY_DELAY)  #don't spin on a camera that fails every time
+                continue
+            if frame is None:
+                continue
+            if station.frames.full():
+                station.frames.get_nowait()  #every decoder is busy, replace the queued frame with this newer one
+            station.frames.put_nowait(frame)
+
+    async def _consume(self, station):#decodes a station's frames on the shared pool and turns confirmed reads into lookups
+        while True:
+            frame = await station.frames.get()
+            isbn = None
+            try:
+                isbn = station.confirm(await self.loop.run_in_executor(self.executor, station.decoder, frame))
+                if isbn:
+                    station.events.put(("book", station.name, isbn, await self._view(isbn)))
+            except Exception as error:
+                if isbn and not station.auto_resume:
+                    station.resume()  #confirm() paused the station for a result that is never coming
+                self._report(station, isbn, error)
+
+    def _report(self, station, isbn, error):#logs a failure and tells the station's front-end, the task carries on
+        print(f"Scan error on {station.name}:", file=sys.stderr)
+        traceback.print_exc()
+        station.events.put(("error", station.name, isbn, str(error) or type(error).__name__))
+
+    async def _view(self, isbn):#the lookup service
+        return await self.loop.run_in_executor(self.io_executor, self.db.get_book_view, isbn,
+                                               self.rec_config["count"], self.rec_config["rank"])
+
+
+#connection settings applied to every pooled connection, WAL lets readers and the writer work at the same time
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  #safe with WAL and avoids an fsync on every commit
+    "cache_size": -16000,  #negative means KiB, so 16 MB of page cache per connection
+    "mmap_size": 268435456,  #read the file through a 256 MB memory map
+    "temp_store": "MEMORY",
+}
+
+
+class ConnectionPool:#small thread-safe pool of long-lived SQLite connections shared by the GUI and worker threads
+    def __init__(self, db_path, size=4, pragmas=None, cached_statements=256):
+        self.db_path = db_path
+        self.size = size  #most connections that will ever be open at once
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements  #prepared statements kept per connection by sqlite3
+        self.idle = queue.LifoQueue()  #most recently used first so its page cache is warm
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _new_connection(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=self.cached_statements)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self):#an idle connection, a new one while under the size limit, otherwise waits for one
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.connections) < self.size:
+                conn = self._new_connection()
+                self.connections.append(conn)
+                return conn
+        return self.idle.get()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()  #never hand out a connection with someone else's half-finished transaction
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.idle = queue.LifoQueue()
+
+
+SEARCH_PREFIXES = (2, 3, 4, 5, 6)  #prefix lengths books_fts indexes, a longer prefix makes FTS5 merge the doclist of every word it starts
+SEARCH_RANKED_MAX = 2000  #books a word may match and still be ranked by bm25, which counts and scores every match of every word
+SEARCH_CANDIDATES = 100  #matches ranked here instead when a word is in more books than that
+
+
+def fts_query(text, prefix=True):#FTS5 query for typed text: finished words exact, the last one a prefix as it may still be being typed
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]  #quoting stops user input being read as FTS5 syntax
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_score(name, author, words):#a name match counts for more than an author match, which counts for more than a summary match
+    score = 0
+    for text, weight in ((name, 10), (author, 5)):
+        tokens = re.findall(r"\w+", str(text or "").lower())
+        score += weight * sum(1 for word in words if any(token.startswith(word) for token in tokens))
+    return score
+
+
+class SchemaError(Exception):#the database is missing something the app needs, raised at startup rather than mid-scan
+    pass
+
+
+def migrate_book_indexes(conn, columns):#lookups by ISBN and name stop being full table scans, genres are indexed by migration 3
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn ON books(ISBN)")
+    except sqlite3.IntegrityError:
+        raise SchemaError("books has duplicate ISBNs, remove them before the ISBN index can be created")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_name ON books(Name)")
+
+
+def migrate_loved_books(conn, columns):#loved status moves out of the catalogue into a per-user table with an integer flag
+    conn.execute("""CREATE TABLE IF NOT EXISTS loved_books (
+                        user_id TEXT NOT NULL,
+                        isbn TEXT NOT NULL,
+                        loved INTEGER NOT NULL DEFAULT 1,
+                        loved_at REAL NOT NULL,
+                        PRIMARY KEY (user_id, isbn)
+                    ) WITHOUT ROWID""")
+    #only loved rows are indexed, newest first is the order the Loved books menu shows them in
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loved_books_user ON loved_books(user_id, loved_at) WHERE loved = 1")
+    #carry existing loved books over to the default user, books.Loved is not read or written after this
+    conn.execute("""INSERT OR IGNORE INTO loved_books (user_id, isbn, loved, loved_at)
+                    SELECT 'default', ISBN, 1, CAST(strftime('%s', 'now') AS REAL) FROM books WHERE Loved = 'True'""")
+
+
+def migrate_ranked_recommendations(conn, columns):#keyset-paginated recommendations ranked by rating or by loved count
+    #walks a genre best-rated first, and the prefix also covers plain Genre lookups. Unrated books score -1 so they
+    #come last, a NULL Rating would make the keyset comparison NULL and they could never appear after the first page
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_genre_rank ON books(Genre, COALESCE(Rating, -1), ISBN)")
+
+    #loved counts are kept up to date by triggers so ranking by them never has to aggregate loved_books
+    conn.execute("""CREATE TABLE IF NOT EXISTS book_stats (
+                        isbn TEXT PRIMARY KEY,
+                        genre TEXT,
+                        loved_count INTEGER NOT NULL DEFAULT 0
+                    ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_book_stats_genre ON book_stats(genre, loved_count, isbn)")
+    conn.execute("""INSERT OR REPLACE INTO book_stats (isbn, genre, loved_count)
+                    SELECT l.isbn, b.Genre, COUNT(*) FROM loved_books l JOIN books b ON b.ISBN = l.isbn
+                    WHERE l.loved = 1 GROUP BY l.isbn""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS loved_books_insert AFTER INSERT ON loved_books WHEN NEW.loved = 1
+                    BEGIN
+                        INSERT INTO book_stats (isbn, genre, loved_count) SELECT NEW.isbn, Genre, 1 FROM books WHERE ISBN = NEW.isbn
+                        ON CONFLICT (isbn) DO UPDATE SET loved_count = loved_count + 1;
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS loved_books_update AFTER UPDATE OF loved ON loved_books WHEN NEW.loved != OLD.loved
+                    BEGIN
+                        INSERT INTO book_stats (isbn, genre, loved_count)
+                        SELECT NEW.isbn, Genre, CASE WHEN NEW.loved = 1 THEN 1 ELSE 0 END FROM books WHERE ISBN = NEW.isbn
+                        ON CONFLICT (isbn) DO UPDATE SET loved_count = loved_count + CASE WHEN NEW.loved = 1 THEN 1 ELSE -1 END;
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS loved_books_delete AFTER DELETE ON loved_books WHEN OLD.loved = 1
+                    BEGIN
+                        UPDATE book_stats SET loved_count = loved_count - 1 WHERE isbn = OLD.isbn;
+                    END""")
+
+
+def migrate_full_text_search(conn, columns):#FTS5 index over name, author and summary, kept in sync with books by triggers
+    name, author, summary = (f'"{columns[i]}"' for i in (1, 2, 5))
+    prefixes = " ".join(str(length) for length in SEARCH_PREFIXES)
+    #external content: the index stores only tokens, the text itself stays in books
+    conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5({name}, {author}, {summary},
+                     content='books', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='{prefixes}')""")
+    #a name match counts for more than an author match, which counts for more than a summary match
+    conn.execute("INSERT INTO books_fts(books_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+                         INSERT INTO books_fts(rowid, {name}, {author}, {summary}) VALUES (NEW.rowid, NEW.{name}, NEW.{author}, NEW.{summary});
+                     END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+                         INSERT INTO books_fts(books_fts, rowid, {name}, {author}, {summary}) VALUES ('delete', OLD.rowid, OLD.{name}, OLD.{author}, OLD.{summary});
+                     END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF {name}, {author}, {summary} ON books BEGIN
+                         INSERT INTO books_fts(books_fts, rowid, {name}, {author}, {summary}) VALUES ('delete', OLD.rowid, OLD.{name}, OLD.{author}, OLD.{summary});
+                         INSERT INTO books_fts(rowid, {name}, {author}, {summary}) VALUES (NEW.rowid, NEW.{name}, NEW.{author}, NEW.{summary});
+                     END""")
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")  #index the books that are already there
+
+
+def migrate_missing_isbns(conn, columns):#negative cache for ISBNs the enrichment backend couldn't find either
+    conn.execute("""CREATE TABLE IF NOT EXISTS missing_isbns (
+                        isbn TEXT PRIMARY KEY,
+                        checked_at REAL NOT NULL
+                    ) WITHOUT ROWID""")
+
+
+#(version, description, function) in the order they run, the applied version is kept in PRAGMA user_version
+MIGRATIONS = [
+    (1, "indexes on ISBN and Name", migrate_book_indexes),
+    (2, "per-user loved_books table", migrate_loved_books),
+    (3, "ranked genre index and loved counts", migrate_ranked_recommendations),
+    (4, "full-text search over name, author and summary", migrate_full_text_search),
+    (5, "negative cache of unknown ISBNs", migrate_missing_isbns),
+]
+
+
+class SchemaManager:#verifies the books table and brings the database up to the newest migration
+    REQUIRED_COLUMNS = ("ISBN", "Name", "Genre", "Rating", "Loved")  #columns the queries use by name
+    EXPECTED_INDEXES = {"idx_books_isbn", "idx_books_name", "idx_books_genre_rank"}  #after the newest migration
+    BOOK_COLUMN_COUNT = 12  #the GUI unpacks rows into 12 fields
+
+    def __init__(self, conn, migrations=MIGRATIONS):
+        self.conn = conn
+        self.migrations = migrations
+
+    def version(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def book_columns(self):#column names of the books table in order
+        return [row[1] for row in self.conn.execute("PRAGMA table_info(books)")]
+
+    def index_names(self):
+        return {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    def verify(self):#raises SchemaError if the books table isn't what the app expects
+        columns = self.book_columns()
+        if not columns:
+            raise SchemaError("no books table in the database")
+        if len(columns) != self.BOOK_COLUMN_COUNT:
+            raise SchemaError(f"books has {len(columns)} columns, expected {self.BOOK_COLUMN_COUNT}")
+        missing = [name for name in self.REQUIRED_COLUMNS if name not in columns]
+        if missing:
+            raise SchemaError(f"books is missing columns: {', '.join(missing)}")
+        return columns
+
+    def migrate(self):#applies every migration newer than the stored version, returns the versions applied
+        columns = self.verify()
+        applied = []
+        for version, description, migration in self.migrations:
+            if version <= self.version():
+                continue
+            self.conn.execute("BEGIN IMMEDIATE")  #each migration and its version bump commit together or not at all
+            try:
+                migration(self.conn, columns)
+                self.conn.execute(f"PRAGMA user_version = {int(version)}")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            applied.append(version)
+        self.verify_indexes()
+        return applied
+
+    def verify_indexes(self):
+        missing = self.EXPECTED_INDEXES - self.index_names()
+        if missing:
+            raise SchemaError(f"missing indexes: {', '.join(sorted(missing))}")
+
+    def suspend_for_bulk_load(self):#drops the secondary indexes and search triggers on books, returns what restore needs
+        #the unique ISBN index stays because upserts need it to find conflicts
+        saved = self.conn.execute("""SELECT type, name, sql FROM sqlite_master
+                                     WHERE tbl_name = 'books' AND type IN ('index', 'trigger')
+                                     AND sql IS NOT NULL AND name != 'idx_books_isbn'""").fetchall()
+        for kind, name, _ in saved:
+            self.conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+        self.conn.commit()
+        return saved
+
+    def restore_after_bulk_load(self, saved):#recreates what suspend dropped and catches derived tables up with books
+        for _, _, sql in saved:
+            self.conn.execute(sql)
+        #one sort per index and one pass over the text is much faster than maintaining them row by row
+        self.conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+        self.conn.execute("UPDATE book_stats SET genre = (SELECT Genre FROM books WHERE ISBN = book_stats.isbn)")
+        self.conn.commit()
+        self.conn.execute("PRAGMA optimize")  #refresh the planner statistics for the new data
+        self.verify_indexes()
 
 
-   
 class Database:#to manage the tasks to do with editing and pulling info from the database
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool_size=4, pragmas=None, migrate=True, user_id="default"):
         self.db_path = db_path
-
-    def _connect(self):#connecting to DB
-        return sqlite3.connect(self.db_path)
+        self.user_id = user_id  #whose loved books this instance reads and writes
+        self.recommender = None  #optional recommender.Recommender behind the "similar" ranking
+        self.pool = ConnectionPool(db_path, pool_size, pragmas)  #connections stay open for the life of the app
+        with self._connect() as conn:
+            schema = SchemaManager(conn)
+            self.applied_migrations = schema.migrate() if migrate else []
+            self.schema_version = schema.version()
+            self.columns = schema.verify()  #books column names, in order
+
+        #book rows keep their 12-field shape, but the legacy Loved column is left out and this user's loved flag (1 or 0) comes last
+        self.row_columns = [name for name in self.columns if name != "Loved"] + ["loved"]  #field names of a book row
+        book_columns = ", ".join(f'b."{name}"' for name in self.row_columns[:-1])
+        self.book_select = (f"SELECT {book_columns}, COALESCE(l.loved, 0) FROM books b "
+                            "LEFT JOIN loved_books l ON l.isbn = b.ISBN AND l.user_id = ?")
+
+    def _connect(self):#borrow a pooled connection, use as "with self._connect() as conn:"
+        return self.pool.connection()
+
+    def close(self):
+        self.pool.close()
+
+    def warm_up(self):#opens every pooled connection and prepares the book lookup on each, so the first scan doesn't pay for it
+        connections = [self.pool.acquire() for _ in range(self.pool.size)]
+        try:
+            for conn in connections:
+                conn.execute(self.book_select + " WHERE b.ISBN = ?", (self.user_id, "")).fetchall()
+        finally:
+            for conn in connections:
+                self.pool.release(conn)
 
     def get_book_data(self, isbn):#retrieving book data 
-        conn = self._connect()
-        cursor = conn.cursor()
-        query = "SELECT * FROM books WHERE ISBN = ?"
-        cursor.execute(query, (isbn,))
-        data = cursor.fetchone()
-        conn.close()
-        return data
-    
+        with self._connect() as conn:
+            return conn.execute(self.book_select + " WHERE b.ISBN = ?", (self.user_id, isbn)).fetchone()
+
+
+    def book_dict(self, row):#a book row as {field name: value} for JSON output, with the loved flag as a bool under "loved"
+        book = dict(zip(self.row_columns, row))
+        book["loved"] = bool(book["loved"])
+        return book
 
 
-    def toggle_loved_status(self, isbn):#change state of the Loved field between True and False
-        conn = self._connect()
-        cursor = conn.cursor()
-        
-        #fetch the current "Loved" field status
-        query = "SELECT Loved FROM books WHERE ISBN = ?"
-        cursor.execute(query, (isbn,))
-        current_status = cursor.fetchone()[0]
-        
-        #field data from string to boolean
-        is_loved = current_status == "True"
-        
-        #toggle the "Loved" status
-        new_status = "False" if is_loved else "True"
-        
-        #update the "Loved" status in the database
-        update_query = "UPDATE books SET Loved = ? WHERE ISBN = ?"
-        cursor.execute(update_query, (new_status, isbn))
-        conn.commit()
-        conn.close()
-
-
-    def get_loved_books(self):#retrieve all book names that have Loved set to true 
-        conn = self._connect()
-        cursor = conn.cursor()
-        query = "SELECT Name FROM books WHERE Loved = 'True'"
-        cursor.execute(query)
-        books = cursor.fetchall()
-        conn.close()
+    def toggle_loved_status(self, isbn):#flips the loved flag in one atomic statement and returns the new state
+        with self._connect() as conn:
+            with conn:
+                #first love inserts the row, after that the conflict branch flips 1 <-> 0
+                loved = conn.execute("""INSERT INTO loved_books (user_id, isbn, loved, loved_at) VALUES (?, ?, 1, ?)
+                                        ON CONFLICT (user_id, isbn) DO UPDATE SET loved = 1 - loved, loved_at = excluded.loved_at
+                                        RETURNING loved""", (self.user_id, str(isbn), time.time())).fetchone()[0]
+        return bool(loved)
+
+
+    def get_loved_books(self):#retrieve the names of this user's loved books, most recently loved first
+        with self._connect() as conn:
+            books = conn.execute("""SELECT b.Name FROM loved_books l JOIN books b ON b.ISBN = l.isbn
+                                    WHERE l.user_id = ? AND l.loved = 1 ORDER BY l.loved_at DESC""",
+                                 (self.user_id,)).fetchall()
         return [book[0] for book in books]  # Extract book names from tuples
-   
 
-  
-    
-    def get_loved_book_data_by_name(self, name):#retrieve info about books based off their names as long as Loved=true
-        conn = self._connect()
-        cursor = conn.cursor()
-        query = "SELECT * FROM books WHERE Name = ? AND Loved = 'True'"
-        cursor.execute(query, (name,))
-        data = cursor.fetchone()
-        conn.close()
-        return data
-    
 
-    def get_book_data_by_name(self, name):#retrieve info about books based off their names
-        conn = self._connect()
-        cursor = conn.cursor()
-        query = "SELECT * FROM books WHERE Name = ?"
-        cursor.execute(query, (name,))
-        data = cursor.fetchone()
-        conn.close()
-        return data
+    def get_loved_book_data_by_name(self, name):#retrieve info about books based off their names as long as they are loved
+        with self._connect() as conn:
+            return conn.execute(self.book_select + " WHERE b.Name = ? AND l.loved = 1", (self.user_id, name)).fetchone()
 
-    
-    def get_books_by_genre(self, genre):#retrieve names of books based off their genre
-        conn = self._connect()
-        cursor = conn.cursor()
-        query = "SELECT Name FROM books WHERE Genre = ?"
-        cursor.execute(query, (genre,))
-        books = cursor.fetchall()
-        conn.close()
-        return [book[0] for book in books]
-    
 
-        
-root = tk.Tk()  #Create the main application window
-app = GUI(root)  #Initialize the GUI application
-root.mainloop()  #Start the main event loop for the GUI
+    def get_book_data_by_name(self, name):#retrieve info about books based off their names
+        with self._connect() as conn:
+            return conn.execute(self.book_select + " WHERE b.Name = ?", (self.user_id, name)).fetchone()
+
+
+    def get_book_view(self, isbn, rec_count=10, rank="rating"):#everything the output page needs, read from one connection in one transaction
+        with self._connect() as conn:
+            conn.execute("BEGIN")  #both reads see the same snapshot
+            try:
+                book = conn.execute(self.book_select + " WHERE b.ISBN = ?", (self.user_id, isbn)).fetchone()
+                recommendations, cursor, source = [], None, rank
+                if book and rank == "similar":
+                    recommendations, cursor = self._similar_page(conn, book[0], rec_count, 0)
+                if book and not recommendations:
+                    #no similarity index, or this book isn't in it yet, so fall back to best-rated in the genre
+                    source = "rating" if rank == "similar" else rank
+                    genre = book[self.row_columns.index("Genre")]
+                    recommendations, cursor = self._genre_page(conn, genre, rec_count, None, book[0], source)
+            finally:
+                conn.commit()
+        return {"book": book, "recommendations": recommendations, "next_cursor": cursor, "source": source,
+                "loved": bool(book and book[-1]), "rec_count": rec_count, "rank": rank}
+
+
+    def get_similar_books(self, isbn, limit=10, after=None):#one page of content-based recommendations, same shape as get_books_by_genre
+        with self._connect() as conn:
+            return self._similar_page(conn, isbn, limit, after or 0)
+
+
+    def _similar_page(self, conn, isbn, limit, offset):#the cursor is simply how far into the neighbour list we are
+        if self.recommender is None:
+            return [], None
+        isbns = self.recommender.similar(isbn, limit, offset)
+        if not isbns:
+            return [], None
+        placeholders = ", ".join("?" * len(isbns))
+        names = {str(row[0]): row[1] for row in conn.execute(f"SELECT ISBN, Name FROM books WHERE ISBN IN ({placeholders})", isbns)}
+        books = [(similar, names[similar]) for similar in isbns if similar in names]  #keep the index's ranking
+        return books, (offset + limit if len(isbns) == limit else None)
+
+
+    def upsert_sql(self):#insert a full books row, or update every catalogue field of the row with the same ISBN
+        placeholders = ", ".join("?" * len(self.columns))
+        #the legacy Loved column is left alone on update, loved status lives in loved_books
+        updates = ", ".join(f'"{name}" = excluded."{name}"' for name in self.columns if name not in ("ISBN", "Loved"))
+        return f'INSERT INTO books VALUES ({placeholders}) ON CONFLICT ("ISBN") DO UPDATE SET {updates}'
+
+
+    def upsert_books(self, rows):#writes full 12-field rows in one transaction, new books or corrections to existing ones
+        rows = list(rows)
+        with self._connect() as conn:
+            with conn:
+                conn.executemany(self.upsert_sql(), rows)
+                conn.executemany("DELETE FROM missing_isbns WHERE isbn = ?", [(str(row[0]),) for row in rows])
+
+
+    def mark_missing(self, isbn):#remember that nobody knows this ISBN, so the next scan doesn't ask again
+        with self._connect() as conn:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO missing_isbns (isbn, checked_at) VALUES (?, ?)", (str(isbn), time.time()))
+
+
+    def is_known_missing(self, isbn, ttl):#True if the ISBN was looked up and not found within the last ttl seconds
+        with self._connect() as conn:
+            row = conn.execute("SELECT checked_at FROM missing_isbns WHERE isbn = ?", (str(isbn),)).fetchone()
+        return row is not None and time.time() - row[0] < ttl
+
+
+    def search_books(self, text, limit=10):#as-you-type search over name, author and summary, returns (ISBN, name, author, snippet) best first
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return []
+        queries = [fts_query(text)]
+        if len(words[-1]) > SEARCH_PREFIXES[-1]:
+            #too long for the prefix index, so try it as a finished word first, which is cheap and usually what was meant
+            queries.insert(0, fts_query(text, prefix=False))
+        name, author = (f'b."{self.columns[i]}"' for i in (1, 2))
+        sql = f"""SELECT b.ISBN, {name}, {author}, snippet(books_fts, -1, '[', ']', '...', 8)
+                  FROM books_fts JOIN books b ON b.rowid = books_fts.rowid WHERE books_fts MATCH ?"""
+        results = {}
+        with self._connect() as conn:
+            for match in queries:
+                if all(self._search_matches(conn, term) <= SEARCH_RANKED_MAX for term in match.split(" ")):
+                    #books with every word in the name, then in the author, then anywhere, each tier best first by bm25
+                    tiers = [f'{{"{self.columns[i]}"}} : ({match})' for i in (1, 2)] + [match]
+                    for tier in tiers:
+                        for row in conn.execute(sql + " ORDER BY rank LIMIT ?", (tier, limit)):
+                            results.setdefault(row[0], row)
+                        if len(results) >= limit:
+                            break
+                else:
+                    #bm25 would count and score every book with the common word first, seconds in a million books,
+                    #so the first SEARCH_CANDIDATES matches are taken as the index yields them and ranked here
+                    candidates = conn.execute(sql + " LIMIT ?", (match, SEARCH_CANDIDATES)).fetchall()
+                    for row in sorted(candidates, key=lambda row: -search_score(row[1], row[2], words)):  #stable, ties keep index order
+                        results.setdefault(row[0], row)
+                if len(results) >= limit:
+                    break
+        return list(results.values())[:limit]
+
+
+    def _search_matches(self, conn, term):#books an FTS5 term is in, counted only up to one past SEARCH_RANKED_MAX
+        return conn.execute("SELECT count(*) FROM (SELECT 1 FROM books_fts WHERE books_fts MATCH ? LIMIT ?)",
+                            (term, SEARCH_RANKED_MAX + 1)).fetchone()[0]
+
+
+    def iter_books(self, batch_size=1000):#every book row, fetched in batches so a big catalogue streams instead of loading at once
+        with self._connect() as conn:
+            cursor = conn.execute(self.book_select, (self.user_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+
+
+    def get_books_by_genre(self, genre, limit=20, after=None, exclude=None, rank="rating"):#one ranked page of (ISBN, name) in a genre
+        #returns (books, cursor), pass the cursor back as after= for the next page, it is None on the last page
+        with self._connect() as conn:
+            return self._genre_page(conn, genre, limit, after, exclude, rank)
+
+
+    def _genre_page(self, conn, genre, limit, after, exclude, rank):
+        #keyset pagination: the cursor is the sort key of the last row, so every page costs the same
+        #however deep into the genre it is, unlike OFFSET which re-reads everything before it
+        if rank == "loved":
+            return self._loved_page(conn, genre, limit, after, exclude)
+        rows = self._rated_rows(conn, genre, limit, after, exclude)
+        cursor = (rows[-1][2], rows[-1][0]) if len(rows) == limit else None  #(score, ISBN)
+        return [(isbn, name) for isbn, name, _ in rows], cursor
+
+
+    def _rated_rows(self, conn, genre, limit, after, exclude, unloved=False):#(ISBN, name, score) best-rated first, after a (score, ISBN)
+        #unrated books score -1 so they come last, written exactly as in idx_books_genre_rank so the index is used,
+        #and spelled out rather than as a row value, which SQLite can't turn into a range on an expression index
+        score = "COALESCE(Rating, -1)"
+        query = f"SELECT ISBN, Name, {score} FROM books WHERE Genre = ? AND ISBN IS NOT ?"
+        params = [genre, exclude]
+        if unloved:
+            #the loved pages have listed these already
+            query += " AND NOT EXISTS (SELECT 1 FROM book_stats s WHERE s.isbn = books.ISBN AND s.genre = books.Genre AND s.loved_count > 0)"
+        if after is not None:
+            query += f" AND {score} <= ? AND ({score} < ? OR ISBN < ?)"
+            params += [after[0], after[0], after[1]]
+        return conn.execute(query + f" ORDER BY {score} DESC, ISBN DESC LIMIT ?", params + [limit]).fetchall()
+
+
+    def _loved_page(self, conn, genre, limit, after, exclude):#most loved first, then the rest of the genre best-rated first
+        #the cursor is (loved count, score, ISBN), a count of 0 means the loved books are used up and paging is into the rest
+        rows = []
+        if after is None or after[0] > 0:
+            #only books that have ever been loved have a count, read from book_stats without aggregating loved_books
+            query = ("SELECT s.isbn, b.Name, s.loved_count, COALESCE(b.Rating, -1) FROM book_stats s JOIN books b ON b.ISBN = s.isbn "
+                     "WHERE s.genre = ? AND s.loved_count > 0 AND s.isbn IS NOT ?")
+            params = [genre, exclude]
+            if after is not None:
+                query += " AND (s.loved_count, COALESCE(b.Rating, -1), s.isbn) < (?, ?, ?)"
+                params += list(after)
+            order = " ORDER BY s.loved_count DESC, COALESCE(b.Rating, -1) DESC, s.isbn DESC LIMIT ?"
+            rows = conn.execute(query + order, params + [limit]).fetchall()
+        if len(rows) < limit:
+            rated_after = after[1:] if after is not None and after[0] == 0 else None
+            rated = self._rated_rows(conn, genre, limit - len(rows), rated_after, exclude, unloved=True)
+            rows += [(isbn, name, 0, score) for isbn, name, score in rated]
+        cursor = (rows[-1][2], rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+        return [(isbn, name) for isbn, name, _, _ in rows], cursor
+
+
+
+def load_recommender(db_path):#the similar-books index if it has been built, otherwise None and genre ranking is used
+    from recommender import Recommender, index_path  #numpy-heavy, so only imported when the "similar" ranking is on
+    path = index_path(db_path)
+    if not os.path.exists(path):
+        return None
+    return Recommender.load(path)
+
+
+def make_enrichment_worker(db, config):#an EnrichmentWorker for the configured backend, None when enrichment is off
+    if not config["backend"]:
+        return None
+    from enrichment import EnrichmentWorker, make_backend
+    return EnrichmentWorker(db, make_backend(config["backend"], config["path"]), config["workers"], config["negative_ttl"])
+
+
+class BookCache:#thread-safe LRU of book rows keyed by normalised ISBN, with an optional time to live
+    MISSING = object()  #returned by get() on a miss, because None is a valid cached "not in the database" row
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl  #seconds an entry stays valid, None for no expiry
+        self.entries = OrderedDict()  #isbn -> (time stored, row), least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, isbn):#ISBN-10 and ISBN-13 forms of the same book share one entry
+        return normalise_isbn(isbn) or str(isbn)
+
+    def get(self, isbn):
+        key = self._key(isbn)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]  #expired
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, isbn, row):
+        key = self._key(isbn)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), row)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, isbn):
+        with self.lock:
+            self.entries.pop(self._key(isbn), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class CachedDatabase(Database):#Database with an LRU of book rows in front, so repeat scans and UI callbacks skip the disk
+    def __init__(self, db_path, pool_size=4, pragmas=None, cache_size=1024, cache_ttl=None, user_id="default"):
+        super().__init__(db_path, pool_size, pragmas, user_id=user_id)
+        self.cache = BookCache(cache_size, cache_ttl)  #book rows
+        self.views = BookCache(cache_size, cache_ttl)  #output page view models, keyed the same way
+
+    def get_book_view(self, isbn, rec_count=10, rank="rating"):
+        isbn = normalise_isbn(isbn) or isbn  #query by the same ISBN the cache is keyed by, or an ISBN-10 miss would be cached for its ISBN-13
+        view = self.views.get(isbn)
+        if view is BookCache.MISSING or view["rec_count"] != rec_count or view["rank"] != rank:
+            view = super().get_book_view(isbn, rec_count, rank)
+            self.views.put(isbn, view)
+            self.cache.put(isbn, view["book"])
+        return view
+
+    def get_book_data(self, isbn):
+        isbn = normalise_isbn(isbn) or isbn  #see get_book_view
+        row = self.cache.get(isbn)
+        if row is BookCache.MISSING:
+            row = super().get_book_data(isbn)
+            self.cache.put(isbn, row)  #rows that aren't found are cached too, so repeated misses stay cheap
+        return row
+
+    def get_book_data_by_name(self, name):#also warms the cache for the ISBN lookup that usually follows
+        row = super().get_book_data_by_name(name)
+        if row:
+            self.cache.put(row[0], row)
+        return row
+
+    def upsert_books(self, rows):#write-through: drop anything cached for the books being written
+        rows = list(rows)
+        super().upsert_books(rows)
+        for row in rows:
+            self.cache.invalidate(row[0])
+            self.views.invalidate(row[0])
+            if self.recommender is not None:
+                self.recommender.add_book(row)  #new books show up in "similar" without a rebuild
+
+    def close(self):#books indexed while running, e.g. found by enrichment, are saved so a restart still has them
+        if self.recommender is not None and self.recommender.unsaved and self.recommender.path:
+            self.recommender.save()
+        super().close()
+
+    def toggle_loved_status(self, isbn):#write-through: the cached row is stale as soon as the loved flag changes
+        loved = super().toggle_loved_status(isbn)
+        self.cache.invalidate(isbn)
+        self.views.invalidate(isbn)
+        return loved
+
+    def cache_stats(self):#counters summed over the row and view caches
+        rows, views = self.cache.stats(), self.views.stats()
+        return {key: rows[key] + views[key] for key in rows}
+
+
+def parse_args(argv=None):#command line flags override the config file
+    parser = argparse.ArgumentParser(description="Blurb-it ISBN scanner")
+    parser.add_argument("--config", help="JSON config file, see DEFAULT_CONFIG for the sections")
+    parser.add_argument("--device", type=int, help="webcam index")
+    parser.add_argument("--devices", help="comma separated webcam indexes, one scan station each, e.g. 0,2")
+    parser.add_argument("--width", type=int, help="capture width in pixels")
+    parser.add_argument("--height", type=int, help="capture height in pixels")
+    parser.add_argument("--fps", type=int, help="capture frame rate")
+    parser.add_argument("--fourcc", help="capture pixel format, e.g. MJPG")
+    parser.add_argument("--buffer-size", type=int, help="driver frame buffer size")
+    parser.add_argument("--preview-fps", type=int, help="target preview frame rate")
+    parser.add_argument("--show-stats", action="store_true", help="overlay preview FPS, jitter, cache counters and confirmation time")
+    parser.add_argument("--db", help="path to the books database")
+    parser.add_argument("--migrate", action="store_true", help="apply database migrations and exit")
+    parser.add_argument("--startup-report", action="store_true", help="print how long each startup phase took")
+    parser.add_argument("--headless", action="store_true", help="scan without a window, printing each book as a JSON line")
+    return parser.parse_args(argv)
+
+
+def config_from_args(args):
+    config = load_config(args.config)
+    for key in ("device", "width", "height", "fps", "fourcc", "buffer_size"):
+        value = getattr(args, key)
+        if value is not None:
+            config["camera"][key] = value
+    if args.devices:
+        config["stations"] = [{"name": f"camera {device}", "camera": {"device": int(device)}}
+                              for device in args.devices.split(",") if device.strip()]
+    if args.preview_fps:
+        config["preview"]["fps"] = args.preview_fps
+    if args.show_stats:
+        config["preview"]["show_stats"] = True
+    if args.startup_report:
+        config["startup"]["report"] = True
+    if args.db:
+        config["database"]["path"] = args.db
+    return config
+
+
+def run_migrations(path):#--migrate: bring the database schema up to date without starting the GUI
+    try:
+        db = Database(path)
+    except SchemaError as error:
+        print(f"Schema error: {error}")
+        return 1
+    if db.applied_migrations:
+        print(f"Applied migrations {db.applied_migrations}, schema is at version {db.schema_version}")
+    else:
+        print(f"Schema is up to date at version {db.schema_version}")
+    db.close()
+    return 0
+
+
+def run_headless(config, out=sys.stdout):#--headless: the same core with no Tk, one JSON line per scanned book from any station
+    try:
+        db = open_database(config)
+    except (SchemaError, sqlite3.Error) as error:
+        print(f"Unable to open the book database: {error}", file=sys.stderr)
+        return 1
+    events = queue.Queue()  #shared by every station, each event carries its station's name
+    core_config = config["core"]
+    stations = []
+    for name, camera_config in station_configs(config):
+        camera = CameraSession(**camera_config)
+        if not camera.open():
+            print(f"Unable to access webcam {camera_config['device']} ({name})", file=sys.stderr)
+            continue
+        camera.start()
+        stations.append(Station(name, camera, BarcodeDecoder(**config["decode"]), ConsensusVoter(**config["consensus"]),
+                                events, auto_resume=True, repeat_cooldown=core_config["repeat_cooldown"]))
+    if not stations:
+        db.close()
+        return 1
+    voters = {station.name: station.voter for station in stations}
+    core = ScanCore(stations, db, config["recommendations"], core_config["decode_workers"])
+    core.start()
+    try:
+        while True:
+            kind, station_name, isbn, view = events.get()
+            if kind == "error":
+                print(json.dumps({"station": station_name, "isbn": isbn, "error": view}), file=out, flush=True)
+                continue
+            book = view["book"]
+            result = {"station": station_name, "isbn": isbn, "found": book is not None}
+            latency = voters[station_name].last_latency
+            if latency is not None:
+                result["confirm_ms"] = round(latency * 1000, 1)  #first agreeing read to confirmation, for tuning the consensus settings
+            if book is not None:
+                result["book"] = db.book_dict(book)
+                result["recommendations"] = [{"isbn": rec_isbn, "name": name} for rec_isbn, name in view["recommendations"]]
+            print(json.dumps(result), file=out, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.stop()
+        for station in stations:
+            station.camera.close()
+        db.close()
+    return 0
+
+
+def main(argv=None):
+    timer = StartupTimer()
+    timer.add("imports", PROCESS_STARTED, time.perf_counter())
+    args = parse_args(argv)
+    config = config_from_args(args)
+    if args.migrate:
+        return run_migrations(config["database"]["path"])
+    if args.headless:
+        return run_headless(config)
+    with timer.phase("create window"):
+        root = tk.Tk()  #Create the main application window
+    app = ScanApp(root, config, timer)  #one window per station, sharing the database and the scan core
+    app.start()  #windows are drawn straight away, the slow parts finish in the background
+    root.mainloop()  #Start the main event loop for the GUI
+    return 0 if app.started else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
 
 
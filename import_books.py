@@ -0,0 +1,146 @@
+import argparse  #command line for the importer
+import csv
+import json
+import os
+import sys
+import time
+
+from isbn import normalise_isbn
+from recommender import index_path
+
+
+NUMERIC_COLUMNS = {4: float, 10: int}  #Rating and Pages, by position in a books row
+
+
+def _field_key(name):#"Good Review 1", "good_review1" and "GoodReview1" all match the same column
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+def read_records(path, file_format=None):#yields one dict per book from a CSV file with a header row or a JSONL file
+    file_format = file_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as source:
+        if file_format == "csv":
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class RowBuilder:#turns loosely named records into full books rows in column order
+    def __init__(self, columns):
+        self.columns = columns
+        self.keys = [_field_key(name) for name in columns]
+        self.skipped = 0  #records with no valid ISBN, no name or a rating or page count that isn't a number
+
+    def build(self, record):#a books row, or None if the record can't be used
+        fields = {_field_key(key): value for key, value in record.items()}
+        isbn = normalise_isbn(fields.get(self.keys[0]) or "")
+        if isbn is None or not fields.get(self.keys[1]):
+            self.skipped += 1
+            return None
+        row = [isbn]
+        for position, key in enumerate(self.keys[1:-1], start=1):
+            value = fields.get(key)
+            if value == "":
+                value = None
+            if value is not None and position in NUMERIC_COLUMNS:
+                try:
+                    value = NUMERIC_COLUMNS[position](float(value))
+                except (TypeError, ValueError, OverflowError):  #e.g. "n/a", a JSON list, or an infinite page count
+                    self.skipped += 1
+                    return None
+            row.append(value)
+        row.append("False")  #legacy Loved column, loved status lives in loved_books
+        return row
+
+
+class Importer:#streams records into books with batched upserts inside large transactions
+    def __init__(self, db, batch_size=5000, transaction_rows=200000, rebuild_indexes=True, progress_every=100000, out=sys.stderr):
+        self.db = db
+        self.batch_size = batch_size  #rows per executemany call
+        self.transaction_rows = transaction_rows  #rows per commit, big transactions avoid a journal sync per batch
+        self.rebuild_indexes = rebuild_indexes  #drop secondary indexes and search triggers for the load, rebuild after
+        self.progress_every = progress_every
+        self.out = out
+        self.rows_written = 0
+        self.started = None
+
+    def run(self, records):#imports an iterable of record dicts, returns (rows written, records skipped)
+        from final import CachedDatabase, SchemaManager  #imported here so enrichment can use RowBuilder without loading the GUI
+        builder = RowBuilder(self.db.columns)
+        sql = self.db.upsert_sql()
+        self.started = time.perf_counter()
+        with self.db.pool.connection() as conn:
+            synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]  #as database.pragmas set it, restored afterwards
+            conn.execute("PRAGMA synchronous = OFF")  #a failed import is simply re-run, so skip the fsyncs
+            schema = SchemaManager(conn)
+            saved = schema.suspend_for_bulk_load() if self.rebuild_indexes else []
+            try:
+                batch = []
+                since_commit = 0
+                next_report = self.progress_every
+                for record in records:
+                    row = builder.build(record)
+                    if row is None:
+                        continue
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        conn.executemany(sql, batch)
+                        self.rows_written += len(batch)
+                        since_commit += len(batch)
+                        batch = []
+                        if since_commit >= self.transaction_rows:
+                            conn.commit()
+                            since_commit = 0
+                        if self.rows_written >= next_report:
+                            self.report(builder.skipped)
+                            next_report += self.progress_every
+                if batch:
+                    conn.executemany(sql, batch)
+                    self.rows_written += len(batch)
+                conn.commit()
+            except BaseException:
+                conn.rollback()  #drop the half-written transaction, the batches committed before it stay
+                raise
+            finally:
+                if saved:
+                    print("Rebuilding indexes and search index...", file=self.out)
+                    schema.restore_after_bulk_load(saved)
+                conn.execute(f"PRAGMA synchronous = {int(synchronous)}")  #the connection goes back to the pool for other work
+        if isinstance(self.db, CachedDatabase):
+            self.db.cache.clear()  #anything cached may have just been overwritten
+            self.db.views.clear()
+        self.report(builder.skipped)
+        return self.rows_written, builder.skipped
+
+    def report(self, skipped):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows_written / elapsed if elapsed else 0.0
+        print(f"{self.rows_written} rows, {skipped} skipped, {elapsed:.1f} s, {rate:.0f} rows/s", file=self.out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import books from CSV or JSONL files")
+    parser.add_argument("files", nargs="+", help="CSV files need a header row, JSONL files one object per line")
+    parser.add_argument("--db", default="Y13/Booktest.db", help="path to the books database")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="file format, guessed from the extension by default")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per executemany call")
+    parser.add_argument("--transaction-rows", type=int, default=200000, help="rows per commit")
+    parser.add_argument("--keep-indexes", action="store_true", help="maintain indexes during the load instead of rebuilding them")
+    args = parser.parse_args(argv)
+
+    from final import Database
+    db = Database(args.db)
+    importer = Importer(db, args.batch_size, args.transaction_rows, not args.keep_indexes)
+    records = (record for path in args.files for record in read_records(path, args.format))
+    written, skipped = importer.run(records)
+    print(f"Imported {written} books, skipped {skipped} records without a valid ISBN, a name or numeric ratings and page counts")
+    if os.path.exists(index_path(args.db)):
+        print("Run 'python recommender.py build' to add the new books to the similar-books index")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+#ISBN and EAN-13 helpers with no imports of their own, so the GUI, importer, enrichment and batch tools can all share them
+
+
+def ean13_check_digit(digits):#check digit for the first 12 digits of an EAN-13/ISBN-13
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_check_digit(digits):#check digit for the first 9 digits of an ISBN-10, "X" stands for 10
+    total = sum((10 - i) * int(d) for i, d in enumerate(digits))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+
+def normalise_isbn(code):#returns the ISBN-13 form of an ISBN-10 or ISBN-13, None if it is not a valid ISBN
+    code = str(code).strip().replace("-", "").replace(" ", "").upper()
+    if len(code) == 10 and code[:9].isdigit() and (code[9].isdigit() or code[9] == "X"):
+        if isbn10_check_digit(code[:9]) != code[9]:
+            return None
+        body = "978" + code[:9]
+        return body + ean13_check_digit(body)
+    if len(code) == 13 and code.isdigit() and code[:3] in ("978", "979"):
+        if ean13_check_digit(code[:12]) == code[12]:
+            return code
+    return None  #wrong length, bad checksum or an EAN that is not a book (UPC-A lands here too)
+
+
+def isbn13_to_isbn10(isbn):#returns the ISBN-10 form of a valid 978 ISBN-13, None when there isn't one
+    isbn = normalise_isbn(isbn)
+    if isbn is None or not isbn.startswith("978"):
+        return None
+    return isbn[3:12] + isbn10_check_digit(isbn[3:12])
@@ -0,0 +1,119 @@
+import argparse  #command line for the load test
+import http.client
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from final import Database
+
+
+def sample_isbns(db_path, count):#random ISBNs from the catalogue to ask for
+    db = Database(db_path)
+    try:
+        with db.pool.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT ISBN FROM books ORDER BY random() LIMIT ?", (count,))]
+    finally:
+        db.close()
+
+
+class Client(threading.Thread):#one keep-alive connection sending requests back to back
+    def __init__(self, host, port, paths, requests, revalidate):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.paths = paths
+        self.requests = requests
+        self.revalidate = revalidate  #send If-None-Match for paths already seen, like a caching client would
+        self.latencies = []
+        self.statuses = Counter()
+        self.etags = {}
+        self.reconnects = 0
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        for _ in range(self.requests):
+            path = random.choice(self.paths)
+            headers = {}
+            if self.revalidate and path in self.etags:
+                headers["If-None-Match"] = self.etags[path]
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()  #the connection can only be reused once the body is drained
+            except (OSError, http.client.HTTPException):
+                self.statuses["error"] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+                self.reconnects += 1
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[response.status] += 1
+            etag = response.getheader("ETag")
+            if etag:
+                self.etags[path] = etag
+        conn.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the lookup service with keep-alive clients")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="where lookup_server.py is listening")
+    parser.add_argument("--db", default="Y13/Booktest.db", help="database to sample ISBNs from")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent connections")
+    parser.add_argument("--requests", type=int, default=500, help="requests per client")
+    parser.add_argument("--isbns", type=int, default=1000, help="distinct ISBNs to ask for")
+    parser.add_argument("--revalidate", action="store_true", help="send If-None-Match, so repeat lookups are 304s")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    isbns = sample_isbns(args.db, args.isbns)
+    if not isbns:
+        print("The database has no books to ask for")
+        return 1
+    #mostly book lookups, like scanning clients, with some recommendation pages and loved lists
+    paths = [f"/books/{isbn}" for isbn in isbns] * 3 + [f"/books/{isbn}/similar" for isbn in isbns] + ["/loved"] * 10
+    url = urlsplit(args.url)
+    clients = [Client(url.hostname, url.port or 80, paths, args.requests, args.revalidate) for _ in range(args.clients)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    statuses = Counter()
+    for client in clients:
+        statuses.update(client.statuses)
+    summary = {
+        "clients": args.clients,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "reconnects": sum(client.reconnects for client in clients),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(summary, out, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
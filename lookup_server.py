@@ -0,0 +1,212 @@
+import argparse  #command line for the lookup service
+import base64
+import hashlib
+import json
+import re
+import sys
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from final import SchemaError, load_config, load_recommender, open_database
+from isbn import normalise_isbn
+
+
+MAX_LIMIT = 100  #most books one page of /similar can ask for
+#the kiosk and the importer write from other processes, cached rows (with their loved flag) are re-read after this long
+CACHE_TTL = 5.0
+
+
+def encode_cursor(source, cursor):#opaque "after" token for the next page, None on the last page
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps([source, cursor]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):#(source, cursor) from an "after" token, raises ValueError if it was tampered with
+    try:
+        source, cursor = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("bad after token")
+    if source == "similar":
+        valid = type(cursor) is int and cursor >= 0  #an offset into the neighbour list
+    elif source in ("rating", "loved"):
+        #sort key of the last book on the previous page: (score, ISBN), or (loved count, score, ISBN) for loved.
+        #bool is an int to Python but not a score
+        size = 2 if source == "rating" else 3
+        valid = (isinstance(cursor, list) and len(cursor) == size and all(type(value) in (int, float) for value in cursor[:-1])
+                 and isinstance(cursor[-1], str))
+        if valid and source == "loved":
+            valid = type(cursor[0]) is int and cursor[0] >= 0
+    else:
+        valid = False
+    if not valid:
+        raise ValueError("bad after token")
+    return source, (cursor if source == "similar" else tuple(cursor))
+
+
+class LookupService:#the JSON answers, kept apart from HTTP so they can be called directly
+    def __init__(self, db, rec_count=10, rank="rating"):
+        self.db = db  #CachedDatabase shared by every request thread
+        self.rec_count = rec_count  #default page size for /similar
+        self.rank = rank  #default ranking for /similar
+
+    def _isbn(self, isbn):#ISBN-10s and hyphenated ISBNs are found under their ISBN-13, anything else is looked up as given
+        return normalise_isbn(isbn) or isbn
+
+    def book(self, isbn):#(status, body) for GET /books/{isbn}
+        isbn = self._isbn(isbn)
+        row = self.db.get_book_data(isbn)
+        if row is None:
+            return 404, {"error": f"no book with ISBN {isbn}"}
+        return 200, {"book": self.db.book_dict(row)}
+
+    def similar(self, isbn, limit=None, rank=None, after=None):#(status, body) for GET /books/{isbn}/similar
+        isbn = self._isbn(isbn)
+        limit = min(max(int(limit or self.rec_count), 1), MAX_LIMIT)
+        rank = rank or self.rank
+        if rank not in ("rating", "loved", "similar"):
+            raise ValueError(f"unknown rank: {rank}")
+        if after is None:
+            view = self.db.get_book_view(isbn, limit, rank)  #first page comes from the same cached view as the app's
+            if view["book"] is None:
+                return 404, {"error": f"no book with ISBN {isbn}"}
+            books, cursor, source = view["recommendations"], view["next_cursor"], view["source"]
+        else:
+            source, cursor = decode_cursor(after)
+            if source == "similar":
+                books, cursor = self.db.get_similar_books(isbn, limit, cursor)
+            else:
+                row = self.db.get_book_data(isbn)
+                if row is None:
+                    return 404, {"error": f"no book with ISBN {isbn}"}
+                genre = row[self.db.row_columns.index("Genre")]
+                books, cursor = self.db.get_books_by_genre(genre, limit, cursor, isbn, source)
+        return 200, {"isbn": isbn, "source": source, "books": [{"isbn": book_isbn, "name": name} for book_isbn, name in books],
+                     "after": encode_cursor(source, cursor)}
+
+    def loved(self):#(status, body) for GET /loved
+        return 200, {"user": self.db.user_id, "books": self.db.get_loved_books()}
+
+
+ROUTES = [
+    (re.compile(r"^/books/([^/]+)$"), "book"),
+    (re.compile(r"^/books/([^/]+)/similar$"), "similar"),
+    (re.compile(r"^/loved$"), "loved"),
+]
+
+
+class LookupHandler(BaseHTTPRequestHandler):#one instance per connection, a connection serves many requests with keep-alive
+    protocol_version = "HTTP/1.1"  #keep-alive by default, so every response needs a Content-Length
+    server_version = "BlurbItLookup/1.0"
+    timeout = 30  #seconds an idle keep-alive connection holds its thread
+    #headers and body go out as two writes, with Nagle on the body waits for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def respond(self, send_body):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        for pattern, route in ROUTES:
+            match = pattern.match(url.path)
+            if match is None:
+                continue
+            try:
+                if route == "book":
+                    status, body = service.book(match.group(1))
+                elif route == "similar":
+                    status, body = service.similar(match.group(1), query.get("limit"), query.get("rank"), query.get("after"))
+                else:
+                    status, body = service.loved()
+            except ValueError as error:
+                status, body = 400, {"error": str(error)}
+            except Exception:
+                #a bug or a database error, answer anyway so the client isn't left with a dropped connection
+                traceback.print_exc()
+                status, body = 500, {"error": "internal error"}
+            break
+        else:
+            status, body = 404, {"error": f"no such resource: {url.path}"}
+        self.send_json(status, body, send_body)
+
+    def send_json(self, status, body, send_body=True):
+        payload = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        #strong ETag from the content, so a client holding the same answer gets an empty 304 instead
+        etag = '"' + hashlib.blake2b(payload, digest_size=12).hexdigest() + '"'
+        if status == 200 and etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 200:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")  #loved status can change, so clients revalidate every time
+        self.end_headers()
+        if send_body:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):#quiet unless --verbose, a load test would otherwise flood the terminal
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class LookupServer(ThreadingHTTPServer):#a thread per connection, all sharing one CachedDatabase and its connection pool
+    daemon_threads = True  #don't wait for idle keep-alive connections on shutdown
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, LookupHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON lookup service over the books database")
+    parser.add_argument("--config", help="JSON config file, the database and recommendations sections are used")
+    parser.add_argument("--db", help="path to the books database")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pool-size", type=int, default=8, help="SQLite connections shared by the request threads")
+    parser.add_argument("--cache-ttl", type=float, help=f"seconds a cached book stays valid, defaults to the config's or {CACHE_TTL:g}")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.db:
+        config["database"]["path"] = args.db
+    config["database"]["pool_size"] = args.pool_size
+    if args.cache_ttl is not None:
+        config["database"]["cache_ttl"] = args.cache_ttl
+    elif config["database"]["cache_ttl"] is None:
+        config["database"]["cache_ttl"] = CACHE_TTL  #the app's default is to never expire, which only works for a single writer
+    try:
+        db = open_database(config)
+    except SchemaError as error:
+        print(f"Schema error: {error}", file=sys.stderr)
+        return 1
+    if db.recommender is None:
+        db.recommender = load_recommender(config["database"]["path"])  #?rank=similar works whenever the index has been built
+    rec_config = config["recommendations"]
+    server = LookupServer((args.host, args.port), LookupService(db, rec_config["count"], rec_config["rank"]), args.verbose)
+    print(f"Serving {config['database']['path']} on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import argparse  #command line for building and querying the index
+import math
+import os
+import re
+import sys
+import threading
+import zlib  #crc32 gives the same hash in every process, unlike hash()
+
+import numpy as np
+
+
+DIMENSIONS = 256  #hashed feature dimensions for text, author and genre
+VOCAB_BUCKETS = 1 << 18  #document frequencies are counted per hash bucket instead of per word
+AUTHOR_WEIGHT = 0.6  #how much a shared author or genre counts next to the summary and reviews
+GENRE_WEIGHT = 0.8
+NUMERIC_WEIGHT = 0.3  #rating and length only nudge the ranking
+TOKEN = re.compile(r"[a-z0-9']+")
+STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "is", "it", "this", "that", "for", "on", "with",
+             "as", "was", "but", "be", "by", "are", "at", "his", "her", "its", "from", "i", "you", "book"}
+
+#positions in a books row, the same 12-field rows Database returns
+NAME, AUTHOR, GENRE, RATING, SUMMARY, PAGES = 1, 2, 3, 4, 5, 10
+REVIEWS = (6, 7, 8, 9)
+
+
+def index_path(db_path):#the index lives next to the database it was built from
+    return db_path + ".recs.npz"
+
+
+def _hash(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def tokenize(row):#words from the summary and the four reviews
+    text = " ".join(str(row[i] or "") for i in (SUMMARY,) + REVIEWS).lower()
+    return [word for word in TOKEN.findall(text) if word not in STOPWORDS]
+
+
+class Recommender:#content-based similar books from a precomputed nearest-neighbour table
+    def __init__(self, isbns, vectors, neighbors, scores, doc_freq, doc_count):
+        self.isbns = list(isbns)
+        #the arrays can have spare rows past len(self.isbns), so add_book only copies them when they are full
+        self.vectors = vectors  #(books, features) float16, L2-normalised so a dot product is the cosine similarity
+        self.neighbors = neighbors  #(books, k) int32 row numbers of the most similar books, best first
+        self.scores = scores  #(books, k) float16 similarity of each neighbour
+        self.doc_freq = doc_freq  #(VOCAB_BUCKETS,) int32 documents containing each hashed word
+        self.doc_count = doc_count
+        self.rows = {isbn: i for i, isbn in enumerate(self.isbns)}  #ISBN -> row number
+        self.lock = threading.Lock()  #add_book can run on a worker thread while the GUI reads
+        self.path = None  #file it was loaded from or last saved to
+        self.unsaved = 0  #books added since then
+
+    @classmethod
+    def build(cls, read_rows, k=50, block_size=None):#builds the whole index, read_rows() returns an iterator of book rows
+        #read_rows is called twice, once for document frequencies and once for the vectors,
+        #so the catalogue text never has to be held in memory
+        doc_freq = np.zeros(VOCAB_BUCKETS, dtype=np.int32)
+        doc_count = 0
+        for row in read_rows():
+            for bucket in {_hash(word) % VOCAB_BUCKETS for word in tokenize(row)}:
+                doc_freq[bucket] += 1
+            doc_count += 1
+
+        recommender = cls([], None, None, None, doc_freq, doc_count)
+        vectors = np.zeros((doc_count, DIMENSIONS + 2), dtype=np.float32)
+        for i, row in enumerate(read_rows()):
+            recommender.isbns.append(str(row[0]))
+            vectors[i] = recommender._features(row, tokenize(row))
+        recommender.rows = {isbn: i for i, isbn in enumerate(recommender.isbns)}
+        recommender.vectors = vectors.astype(np.float16)
+        recommender.neighbors, recommender.scores = recommender._all_neighbors(vectors, k, block_size)
+        return recommender
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        recommender = cls(data["isbns"].tolist(), data["vectors"], data["neighbors"], data["scores"],
+                          data["doc_freq"], int(data["doc_count"]))
+        recommender.path = path
+        return recommender
+
+    def save(self, path=None):#written to a temporary file first so a crash never leaves half an index behind
+        path = path or self.path
+        temp_path = path + ".tmp.npz"
+        with self.lock:
+            count = len(self.isbns)  #spare rows aren't saved
+            np.savez(temp_path, isbns=np.array(self.isbns), vectors=self.vectors[:count], neighbors=self.neighbors[:count],
+                     scores=self.scores[:count], doc_freq=self.doc_freq, doc_count=np.int64(self.doc_count))
+            os.replace(temp_path, path)
+            self.path = path
+            self.unsaved = 0
+
+    def similar(self, isbn, k=10, offset=0):#ISBNs of the k most similar books, [] if the book isn't indexed
+        with self.lock:
+            row = self.rows.get(str(isbn))
+            if row is None:
+                return []
+            return [self.isbns[i] for i in self.neighbors[row, offset:offset + k] if i >= 0]
+
+    def add_book(self, row):#indexes a new or changed book without rebuilding everything
+        with self.lock:
+            self._add_book(row)
+            self.unsaved += 1
+
+    def _add_book(self, row):
+        words = tokenize(row)
+        isbn = str(row[0])
+        if isbn not in self.rows:
+            #idf of existing books drifts slightly until the next full build, which is fine for ranking
+            for bucket in {_hash(word) % VOCAB_BUCKETS for word in words}:
+                self.doc_freq[bucket] += 1
+            self.doc_count += 1
+        vector = self._features(row, words)
+        sims = self._similarities(vector)
+
+        position = self.rows.get(isbn)
+        if position is None:
+            position = len(self.isbns)
+            self._reserve(position + 1)
+            self.isbns.append(isbn)
+            self.rows[isbn] = position
+            self.vectors[position] = vector.astype(np.float16)
+            sims = np.append(sims, -np.inf)  #never its own neighbour
+        else:
+            self.vectors[position] = vector.astype(np.float16)
+            sims[position] = -np.inf
+
+        #the new book's own neighbours
+        k = self.neighbors.shape[1]
+        top = self._top_k(sims[np.newaxis, :], k)[0]
+        self.neighbors[position] = top
+        self.scores[position] = sims[top]
+
+        #books that now have it among their k most similar, replacing their current worst neighbour
+        closer = np.nonzero(sims > self.scores[:len(self.isbns), -1].astype(np.float32))[0]
+        closer = closer[np.all(self.neighbors[closer] != position, axis=1)]
+        for i in closer:
+            self.neighbors[i, -1] = position
+            self.scores[i, -1] = sims[i]
+            order = np.argsort(-self.scores[i].astype(np.float32), kind="stable")
+            self.neighbors[i] = self.neighbors[i, order]
+            self.scores[i] = self.scores[i, order]
+
+    def _reserve(self, count):#makes room for count books, growing by a quarter at a time so adds copy the arrays only now and then
+        capacity = len(self.vectors)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity + capacity // 4, 1024)  #a quarter rather than double, the arrays are large already
+        self.vectors = self._grown(self.vectors, capacity, 0)
+        self.neighbors = self._grown(self.neighbors, capacity, -1)
+        self.scores = self._grown(self.scores, capacity, -np.inf)
+
+    def _grown(self, array, capacity, fill):
+        grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def _similarities(self, vector, chunk=65536):#cosine similarity of one vector to every book, without a float32 copy of them all
+        count = len(self.isbns)
+        sims = np.empty(count, dtype=np.float32)
+        for start in range(0, count, chunk):
+            end = min(start + chunk, count)
+            sims[start:end] = self.vectors[start:end].astype(np.float32) @ vector
+        return sims
+
+    def _features(self, row, words):#TF-IDF of the text plus author, genre, rating and length, hashed into one vector
+        vector = np.zeros(DIMENSIONS + 2, dtype=np.float32)
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for word, count in counts.items():
+            h = _hash(word)
+            idf = math.log((1 + self.doc_count) / (1 + self.doc_freq[h % VOCAB_BUCKETS])) + 1
+            #the sign bit keeps hash collisions from always adding up
+            vector[h % DIMENSIONS] += (1 + math.log(count)) * idf * (1 if h & 0x80000000 else -1)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+
+        if row[AUTHOR]:
+            vector[_hash("author:" + str(row[AUTHOR]).lower()) % DIMENSIONS] += AUTHOR_WEIGHT
+        if row[GENRE]:
+            vector[_hash("genre:" + str(row[GENRE]).lower()) % DIMENSIONS] += GENRE_WEIGHT
+        rating = float(row[RATING] or 0)
+        pages = float(row[PAGES] or 0)
+        vector[DIMENSIONS] = NUMERIC_WEIGHT * min(rating, 5.0) / 5.0
+        vector[DIMENSIONS + 1] = NUMERIC_WEIGHT * min(math.log1p(pages) / math.log1p(2000), 1.0)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _all_neighbors(self, vectors, k, block_size=None):#exact top-k for every book, a block of rows at a time
+        count = len(vectors)
+        k = min(k, max(count - 1, 1))
+        if block_size is None:
+            block_size = max(1, min(1024, (1 << 26) // max(count, 1)))  #keeps each similarity block around 256 MB
+        neighbors = np.empty((count, k), dtype=np.int32)
+        scores = np.empty((count, k), dtype=np.float16)
+        for start in range(0, count, block_size):
+            sims = vectors[start:start + block_size] @ vectors.T
+            rows = np.arange(sims.shape[0])
+            sims[rows, start + rows] = -np.inf  #a book is not its own recommendation
+            top = self._top_k(sims, k)
+            neighbors[start:start + block_size] = top
+            scores[start:start + block_size] = np.take_along_axis(sims, top, axis=1)
+        return neighbors, scores
+
+    def _top_k(self, sims, k):#column numbers of the k largest values in each row, largest first
+        k = min(k, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1).astype(np.int32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the similar-books index")
+    parser.add_argument("command", choices=["build", "add", "similar"])
+    parser.add_argument("isbn", nargs="?", help="book to add or look up")
+    parser.add_argument("--db", default="Y13/Booktest.db", help="path to the books database")
+    parser.add_argument("--neighbours", type=int, default=50, help="similar books stored per book")
+    parser.add_argument("-k", type=int, default=10, help="results for the similar command")
+    args = parser.parse_args(argv)
+
+    from final import Database  #only needed here, the GUI imports this module the other way round
+    path = index_path(args.db)
+    if args.command == "build":
+        db = Database(args.db)
+        recommender = Recommender.build(db.iter_books, args.neighbours)
+        recommender.save(path)
+        print(f"Indexed {len(recommender.isbns)} books into {path}")
+        return 0
+
+    if not args.isbn:
+        parser.error(f"{args.command} needs an ISBN")
+    isbn = normalise_isbn(args.isbn) or args.isbn
+    recommender = Recommender.load(path)
+    if args.command == "add":
+        row = Database(args.db).get_book_data(isbn)
+        if row is None:
+            print(f"{isbn} is not in the database")
+            return 1
+        recommender.add_book(row)
+        recommender.save()
+        print(f"Indexed {isbn}, {len(recommender.isbns)} books in the index")
+    else:
+        for similar_isbn in recommender.similar(isbn, args.k):
+            print(similar_isbn)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())